@@ -0,0 +1,110 @@
+"""Job-scoped cache of decoded background images, loaded fonts and rasterized text"""
+import functools
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageFont
+
+def load_background(bg_image_path, size):
+    """Load a background image as RGB, resized to size"""
+    try:
+        bg_image = Image.open(bg_image_path).convert("RGB")
+    except Exception as e:
+        print(f"Error loading background image {bg_image_path}: {e}")
+        # Create a default background
+        bg_image = Image.new("RGB", size, (50, 50, 50))
+
+    # Resize to standard video dimensions if needed
+    if bg_image.size != tuple(size):
+        bg_image = bg_image.resize(size, Image.Resampling.LANCZOS)
+    return bg_image
+
+def load_font(font_path, font_size):
+    """Load a TrueType font, falling back to PIL's default font"""
+    try:
+        return ImageFont.truetype(font_path, size=font_size)
+    except (OSError, IOError):
+        # Fallback to default font if custom font not found
+        print(f"Warning: Could not load font {font_path}, using default font")
+        return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=None)
+def font_file(font_path):
+    """
+    File PIL loads for a font, or None if it falls back to its default font
+
+    A bare name such as "Arial.ttf" is looked up in the system font
+    directories, so it is usually not a path relative to the working
+    directory. Lookups are remembered, the file found is not.
+    """
+    try:
+        return os.path.abspath(ImageFont.truetype(font_path, size=12).path)
+    except (OSError, IOError):
+        return None
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+class AssetCache:
+    """
+    Decoded, pre-resized backgrounds and loaded fonts shared by the segments of a job
+
+    Entries are keyed by path and modification time, plus the target size for
+    backgrounds and the point size for fonts, so an edited file is reloaded.
+    Backgrounds are kept as read-only RGB uint8 arrays shared by all callers.
+    Text blocks are rasterized once by ``text``, a TextRasterCache using these
+    fonts.
+    """
+
+    def __init__(self):
+        from textcache import TextRasterCache  # textcache uses this module's font loading
+
+        self._backgrounds = {}
+        self._fonts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.text = TextRasterCache(font_loader=self.font)
+
+    def _get(self, store, key, load):
+        with self._lock:
+            if key in store:
+                self.hits += 1
+                return store[key]
+            self.misses += 1
+        value = load()
+        with self._lock:
+            return store.setdefault(key, value)
+
+    def background(self, bg_image_path, size):
+        """Return the background at path resized to size, as a read-only RGB array"""
+        size = tuple(size)
+        key = (os.path.abspath(bg_image_path), _mtime(bg_image_path), size)
+
+        def load():
+            frame = np.array(load_background(bg_image_path, size))
+            frame.flags.writeable = False
+            return frame
+
+        return self._get(self._backgrounds, key, load)
+
+    def font(self, font_path, font_size):
+        """Return the font at path loaded at font_size"""
+        key = (font_path, _mtime(font_path), font_size)
+        return self._get(self._fonts, key, lambda: load_font(font_path, font_size))
+
+    def stats(self):
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "text": self.text.stats()}
+
+    def clear(self):
+        with self._lock:
+            self._backgrounds.clear()
+            self._fonts.clear()
+        self.text.clear()
@@ -0,0 +1,243 @@
+"""
+Render many text-to-video jobs on a shared worker pool
+
+A job is a JSON object with the arguments of ``create_text_to_video``:
+
+    {"id": "intro", "script": [["First line.", 3], ["Second line.", 4]],
+     "bg_image_path": "bg_generic.jpg", "output_path": "out/intro.mp4",
+     "render_mode": "static", "incremental": true, "profile": "720p"}
+
+``script_path`` (a JSON list, or JSONL with one segment per line) can be used
+instead of ``script``; with ``"render_mode": "stream"`` a JSONL script is
+rendered while it is read, in constant memory. With ``trace_path`` the job's
+spans are written there as a Chrome trace and their summary (time per
+stage, cache hit rates, peak memory) is added to its status. Relative paths are resolved
+from the directory of the file the job was read from.
+
+Usage:
+    python batch.py jobs.jsonl --workers 4 --max-encoders 2 --status status.jsonl
+    python batch.py jobs_dir/ --max-memory-mb 4096
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import main
+import tracing
+from assets import AssetCache
+from tts import DEFAULT_CACHE_DIR, AudioCache, GTTSSynthesizer, Pyttsx3Synthesizer, StubSynthesizer
+
+SYNTHESIZERS = {
+    "gtts": GTTSSynthesizer,
+    "pyttsx3": Pyttsx3Synthesizer,
+    "stub": StubSynthesizer,
+}
+
+JOB_PATH_KEYS = ("script_path", "bg_image_path", "output_path", "trace_path")
+
+def load_jobs(source):
+    """Read jobs from a JSONL file (one job per line) or a directory of .json job files"""
+    if os.path.isdir(source):
+        entries = []
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".json"):
+                path = os.path.join(source, name)
+                with open(path) as f:
+                    entries.append((os.path.splitext(name)[0], json.load(f), source))
+    else:
+        entries = []
+        with open(source) as f:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    entries.append((f"line{line_number}", json.loads(line), os.path.dirname(source)))
+
+    jobs = []
+    for default_id, job, base_dir in entries:
+        job = dict(job)
+        job.setdefault("id", default_id)
+        for key in JOB_PATH_KEYS:
+            if key in job and not os.path.isabs(job[key]):
+                job[key] = os.path.join(base_dir, job[key])
+        jobs.append(job)
+    return jobs
+
+def load_script(script_path):
+    """Read a script from a JSON list, or lazily from a JSONL file with one segment per line"""
+    if script_path.endswith(".jsonl"):
+        return main.iter_script_jsonl(script_path)
+    with open(script_path) as f:
+        return json.load(f)
+
+# Caches of the current worker process, shared by all the jobs it runs
+_worker_tts_cache = None
+_worker_assets = None
+# Shared flags of the pool, set when the job of that index starts
+_worker_started = None
+
+def _init_worker(encoder_slots, max_memory_mb, tts_cache_dir, synthesizer, started=None):
+    global _worker_tts_cache, _worker_assets, _worker_started
+    _worker_started = started
+    if max_memory_mb:
+        try:
+            import resource
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"Warning: could not set a memory limit of {max_memory_mb} MB: {e}")
+    main.set_encoder_slots(encoder_slots)
+    _worker_tts_cache = AudioCache(synthesizer, cache_dir=tts_cache_dir)
+    _worker_assets = AssetCache()
+
+def run_job(job, index=None):
+    """Run one job in a worker, returns its status instead of raising"""
+    if _worker_started is not None and index is not None:
+        _worker_started[index] = 1
+    started = time.time()
+    result = {"id": job["id"], "output_path": job.get("output_path"), "started": started}
+    tracer = tracing.Tracer() if job.get("trace_path") else None
+    try:
+        if "script" in job:
+            script = job["script"]
+        else:
+            script = load_script(job["script_path"])
+        render_mode = job.get("render_mode", "static")
+        if render_mode == "parallel":
+            # The batch pool already spreads work over the cores
+            render_mode = "static"
+        main.create_text_to_video(
+            script,
+            bg_image_path=job.get("bg_image_path", "bg_generic.jpg"),
+            output_path=job["output_path"],
+            render_mode=render_mode,
+            incremental=job.get("incremental", False),
+            profile=job.get("profile"),
+            tts_cache=_worker_tts_cache,
+            assets=_worker_assets,
+            tracer=tracer,
+        )
+        result["status"] = "ok"
+    except BaseException as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.time() - started
+    if tracer is not None:
+        tracer.export_chrome_trace(job["trace_path"])
+        result["trace"] = tracer.summary()
+    result["assets"] = _worker_assets.stats() if _worker_assets else None
+    result["tts_cache"] = _worker_tts_cache.stats() if _worker_tts_cache else None
+    return result
+
+def _worker_died(job):
+    return {"id": job["id"], "output_path": job.get("output_path"), "status": "failed",
+            "error": "Worker process died (killed, out of memory or crashed)"}
+
+def _run_pool(jobs, indices, workers, initargs, report):
+    """
+    Run the jobs at indices on a new process pool, passing each status to report(index, result)
+
+    If a worker dies the pool can't run anything else: returns the indices of
+    the unfinished jobs, split into those that had started and those still queued.
+    """
+    started = multiprocessing.Array("b", len(jobs), lock=False)
+    running, queued = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs + (started,)) as pool:
+        futures = {pool.submit(run_job, jobs[index], index): index for index in indices}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                report(index, future.result())
+            except BrokenProcessPool:
+                (running if started[index] else queued).append(index)
+    return running, queued
+
+def run_batch(jobs, workers=None, max_encoders=None, max_memory_mb=None, tts_cache_dir=DEFAULT_CACHE_DIR,
+              synthesizer=None, status_path=None):
+    """
+    Run jobs on a shared process pool, returns one status dict per job in job order
+
+    Args:
+        jobs: Job dicts, see load_jobs
+        workers: Number of worker processes (CPU cap), defaults to the number of CPUs
+        max_encoders: Maximum number of encoders running at once across all workers
+        max_memory_mb: Address space limit of each worker process and its encoders
+        tts_cache_dir: TTS cache directory shared by all the workers
+        synthesizer: TTS backend, defaults to gTTS
+        status_path: JSONL file receiving each job's status as soon as it finishes
+
+    A failing job is reported with status "failed" and never stops the batch.
+    When a job kills its worker (OOM killer, crash in native code), only that
+    job fails: the others are run again on a new pool.
+    """
+    encoder_slots = multiprocessing.Semaphore(max_encoders) if max_encoders else None
+    initargs = (encoder_slots, max_memory_mb, tts_cache_dir, synthesizer)
+    results = {}
+    status_file = open(status_path, "a") if status_path else None
+
+    def report(index, result):
+        results[index] = result
+        print(f"[{len(results)}/{len(jobs)}] {result['id']}: {result['status']}"
+              + (f" in {result['seconds']:.1f}s" if "seconds" in result else "")
+              + (f" ({result['error']})" if "error" in result else ""))
+        if status_file:
+            status_file.write(json.dumps(result) + "\n")
+            status_file.flush()
+
+    try:
+        pending = list(range(len(jobs)))
+        while pending:
+            running, queued = _run_pool(jobs, pending, workers, initargs, report)
+            if not running:
+                # Died before running any job (e.g. in the initializer), it would happen again
+                for index in queued:
+                    report(index, _worker_died(jobs[index]))
+                break
+            if len(running) == 1:
+                report(running[0], _worker_died(jobs[running[0]]))
+            else:
+                # Several jobs were running when a worker died: run each alone to find the one that killed it
+                print(f"A worker died, running {len(running)} interrupted jobs one by one")
+                for index in running:
+                    died, _ = _run_pool(jobs, [index], 1, initargs, report)
+                    for index in died:
+                        report(index, _worker_died(jobs[index]))
+            pending = queued
+    finally:
+        if status_file:
+            status_file.close()
+    return [results[index] for index in range(len(jobs))]
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Render a batch of text-to-video jobs")
+    parser.add_argument("jobs", help="JSONL file of jobs, or a directory of .json job files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-encoders", type=int, default=None, help="encoders running at once")
+    parser.add_argument("--max-memory-mb", type=int, default=None, help="memory limit per worker")
+    parser.add_argument("--tts-cache", default=DEFAULT_CACHE_DIR, help="shared TTS cache directory")
+    parser.add_argument("--tts-backend", choices=sorted(SYNTHESIZERS), default="gtts", help="TTS backend")
+    parser.add_argument("--status", default=None, help="JSONL file to append job statuses to")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.jobs)
+    started = time.time()
+    results = run_batch(
+        jobs,
+        workers=args.workers,
+        max_encoders=args.max_encoders,
+        max_memory_mb=args.max_memory_mb,
+        tts_cache_dir=args.tts_cache,
+        synthesizer=SYNTHESIZERS[args.tts_backend](),
+        status_path=args.status,
+    )
+    failed = [result for result in results if result["status"] != "ok"]
+    print(f"{len(results) - len(failed)}/{len(results)} jobs succeeded in {time.time() - started:.1f}s")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,261 @@
+"""
+Benchmark of the text-to-video and trailer pipelines, on synthetic inputs
+
+Everything is generated offline in a temporary directory: a background
+image, a script of N segments, a synthetic source video standing in for
+bbb.mp4, and speech from the stub TTS backend. Each stage is timed on its
+own and the results are written as JSON:
+
+    {"config": {...}, "peak_rss_mb": ..., "stages": {"make_clip": {"seconds": ...,
+     "items": ..., "per_second": ...}, ...}}
+
+With --baseline, the results are compared to a previous run and stages
+slower than the baseline by more than --tolerance (and --min-seconds) are
+reported as regressions (exit code 1).
+
+Usage:
+    python benchmark.py --segments 20 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from moviepy import TextClip, vfx
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from PIL import Image
+
+import main
+from assets import AssetCache
+from color import compile_color, sepia
+from decoders import DecoderPool
+from encoding import encode_video, encoder_settings
+from profiles import get_profile
+from timeline import CrossFadeIn, CrossFadeOut, TimelineCompositeVideoClip
+from tracing import peak_rss_mb
+from tts import AudioCache, StubSynthesizer
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "font", "font.ttf")
+
+WORDS = ("motion frame layer render image script audio timeline video scene effect color "
+         "transition keyframe overlay segment").split()
+
+def synthetic_script(n_segments, seed=0):
+    """Script of n segments of 4 to 24 words, with durations"""
+    rng = np.random.default_rng(seed)
+    script = []
+    for i in range(n_segments):
+        words = rng.choice(WORDS, size=int(rng.integers(4, 25)))
+        script.append((f"Segment {i}: " + " ".join(words) + ".", float(rng.integers(2, 5))))
+    return script
+
+def synthetic_background(path, size=(1920, 1080)):
+    """Gradient background image"""
+    x, y = np.meshgrid(np.linspace(0, 1, size[0]), np.linspace(0, 1, size[1]))
+    frame = np.dstack([40 + 80 * x, 30 + 60 * y, 90 + 50 * x * y]).astype(np.uint8)
+    Image.fromarray(frame).save(path, quality=95)
+    return path
+
+def synthetic_video(path, duration=20, size=(1280, 720), fps=24):
+    """Moving pattern video with a changing picture every frame, standing in for bbb.mp4"""
+    w, h = size
+    xx, yy = np.meshgrid(np.arange(w), np.arange(h))
+    with FFMPEG_VideoWriter(path, size, fps, preset="ultrafast", ffmpeg_params=["-g", str(fps * 4)]) as writer:
+        for n in range(int(duration * fps)):
+            r = (xx + 4 * n) % 256
+            g = (yy + 2 * n) % 256
+            b = ((xx + yy) // 4 + 8 * n) % 256
+            writer.write_frame(np.dstack([r, g, b]).astype(np.uint8))
+    return path
+
+def sepia_float(frame):
+    """Float sepia filter, same as trailer.py's sepia_filter"""
+    sepia_matrix = np.array([[0.393, 0.769, 0.189], [0.349, 0.686, 0.168], [0.272, 0.534, 0.131]])
+    return np.clip(np.dot(frame.astype(np.float32), sepia_matrix.T), 0, 255).astype(np.uint8)
+
+class Stages:
+    """Per-stage timings"""
+
+    def __init__(self):
+        self.results = {}
+
+    def time(self, name, function, items=1, unit="items"):
+        started = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - started
+        self.results[name] = {
+            "seconds": seconds,
+            "items": items,
+            "unit": unit,
+            "per_second": items / seconds if seconds > 0 else None,
+        }
+        print(f"{name:>28}: {seconds:8.3f}s  {items / seconds if seconds > 0 else 0:10.1f} {unit}/s")
+        return value
+
+def bench_text_to_video(stages, work_dir, n_segments, profile):
+    script = synthetic_script(n_segments)
+    bg_path = synthetic_background(os.path.join(work_dir, "bg.jpg"))
+    tts_cache = AudioCache(StubSynthesizer(), cache_dir=os.path.join(work_dir, "tts"))
+    assets = AssetCache()
+    size = profile.size
+
+    stages.time("tts", lambda: [tts_cache.get(text) for text, _ in script], n_segments, "segments")
+    stages.time("create_text_overlay", lambda: [
+        main.create_text_overlay(text, size, FONT_PATH, main.SEGMENT_FONT_SIZE) for text, _ in script
+    ], n_segments, "segments")
+    # Second pass over the same texts, as when re-rendering an unchanged script
+    overlays_cached = lambda: [
+        main.create_text_overlay(text, size, FONT_PATH, main.SEGMENT_FONT_SIZE, assets=assets) for text, _ in script
+    ]
+    overlays_cached()
+    stages.time("create_text_overlay_cached", overlays_cached, n_segments, "segments")
+    clips = stages.time("make_clip", lambda: [
+        main.make_clip(text, duration, bg_path, FONT_PATH, main.SEGMENT_FONT_SIZE, assets=assets, size=size)
+        for text, duration in script
+    ], n_segments, "segments")
+
+    segment_paths = [os.path.join(work_dir, f"segment_{i:05d}.mp4") for i in range(n_segments)]
+    frames = int(sum(duration for _, duration in script) * profile.fps)
+
+    def encode():
+        for (text, _), clip, path in zip(script, clips, segment_paths):
+            main.encode_segment(clip, path, tts_cache.get(text), profile=profile)
+
+    stages.time("encode_segments", encode, frames, "frames")
+    main.close_clips(clips)
+    stages.time("concatenate", lambda: main.concatenate_segment_files(
+        segment_paths, os.path.join(work_dir, "text_to_video.mp4")
+    ), n_segments, "segments")
+    stages.time("create_text_to_video_static", lambda: main.create_text_to_video(
+        script, bg_path, os.path.join(work_dir, "static.mp4"), render_mode="static",
+        tts_cache=tts_cache, assets=AssetCache(), profile=profile,
+    ), frames, "frames")
+
+def bench_trailer(stages, work_dir, profile, duration=8):
+    video_path = synthetic_video(os.path.join(work_dir, "source.mp4"))
+    decoders = DecoderPool()
+    try:
+        # Same structure as trailer.py: scenes cut from one file, titles, crossfades, sepia and slow motion
+        scene_a = decoders.subclip(video_path, 1, 4).with_effects([CrossFadeOut(1)])
+        scene_b = decoders.subclip(video_path, 10, 12).with_effects([CrossFadeIn(1), CrossFadeOut(1)])
+        scene_b = scene_b.with_start(scene_a.end - 1)
+        scene_c = decoders.subclip(video_path, 15, 17).image_transform(compile_color(sepia()))
+        scene_c = scene_c.with_effects([vfx.MultiplySpeed(0.5), CrossFadeIn(1)]).with_start(scene_b.end - 1)
+        titles = [
+            TextClip(font=FONT_PATH, text=text, font_size=50, color="#fff")
+            .with_start(start).with_duration(2).with_position(("center", "center"))
+            .with_effects([CrossFadeIn(0.5), CrossFadeOut(0.5)])
+            for start, text in ((0, "An unlucky bird"), (3, "A bunny"), (6, "Revenge is coming..."))
+        ]
+        composite = TimelineCompositeVideoClip(
+            [scene_a, scene_b, scene_c] + titles, bg_color=(0, 0, 0)
+        ).with_duration(duration)
+        fps = profile.fps
+        n_frames = int(composite.duration * fps)
+
+        def frame_loop():
+            for n in range(n_frames):
+                composite.get_frame(n / fps)
+
+        stages.time("composite_frames", frame_loop, n_frames, "frames")
+
+        frames = [decoders.subclip(video_path, 0, 2).get_frame(n / fps) for n in range(min(24, n_frames))]
+        sepia_filter = compile_color(sepia())
+        stages.time("sepia_float", lambda: [sepia_float(frame) for frame in frames], len(frames), "frames")
+        stages.time("sepia_compiled", lambda: [sepia_filter(frame) for frame in frames], len(frames), "frames")
+
+        def encode():
+            frames = (composite.get_frame(n / fps) for n in range(n_frames))
+            encode_video(os.path.join(work_dir, "trailer.mp4"), frames, composite.size, fps,
+                         encoder_settings(profile, "film"))
+
+        stages.time("composite_encode", encode, n_frames, "frames")
+    finally:
+        decoders.close()
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    Return the stages slower than the baseline by more than tolerance, and print the comparison
+
+    Slowdowns shorter than min_seconds are timer noise and never flagged.
+    """
+    regressions = []
+    print(f"\n{'stage':>28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if previous is None or not previous["seconds"]:
+            print(f"{name:>28} {'-':>10} {current['seconds']:10.3f}")
+            continue
+        change = current["seconds"] / previous["seconds"] - 1
+        flag = ""
+        if change > tolerance and current["seconds"] - previous["seconds"] > min_seconds:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:>28} {previous['seconds']:10.3f} {current['seconds']:10.3f} {change:+8.1%}{flag}")
+    return regressions
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the text-to-video and trailer pipelines")
+    parser.add_argument("--segments", type=int, default=20, help="number of script segments")
+    parser.add_argument("--profile", default="720p", help="render profile")
+    parser.add_argument("--only", choices=["text", "trailer"], default=None, help="run a single pipeline")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown per stage (0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns shorter than this")
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    args = parser.parse_args(argv)
+
+    profile = get_profile(args.profile)
+    stages = Stages()
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    started = time.time()
+    try:
+        if args.only in (None, "text"):
+            bench_text_to_video(stages, work_dir, args.segments, profile)
+        if args.only in (None, "trailer"):
+            bench_trailer(stages, work_dir, profile)
+    finally:
+        if args.keep:
+            print(f"Generated files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "config": {
+            "segments": args.segments,
+            "profile": profile.name,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "started": started,
+        "total_seconds": time.time() - started,
+        "peak_rss_mb": {"self": peak_rss_mb(), "children": peak_rss_mb(children=True)},
+        "stages": stages.results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed: {', '.join(regressions)}")
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,159 @@
+"""
+Render a clip with several processes, each encoding one time range
+
+The timeline is cut into chunks of whole GOPs; worker processes forked from
+the caller render and encode their chunks from the same clip graph (nothing
+is pickled), while the caller renders the audio once. Chunks are then
+joined and muxed with the audio without re-encoding.
+
+Every frame is computed exactly as ``write_videofile`` computes it (same
+times, same mask handling), so the pictures are identical to a serial
+render; only where the encoder starts a new GOP is fixed.
+
+Example:
+    write_videofile_chunked(final_clip, "./result.mp4", workers=32)
+"""
+import gc
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from moviepy.audio.io.readers import FFMPEG_AudioReader
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+from encoding import EncoderSettings, concat_list_entry, concatenate_list_file, encode_video
+
+# Clip being rendered, inherited by the forked workers
+_clip = None
+
+def _reset_readers():
+    # The ffmpeg processes of the readers belong to the parent: forget them, readers reopen on the next frame
+    for obj in gc.get_objects():
+        if isinstance(obj, (FFMPEG_VideoReader, FFMPEG_AudioReader)) and obj.proc is not None:
+            obj.proc = None
+
+def chunk_ranges(n_frames, gop, chunks):
+    """Split [0, n_frames) into at most `chunks` ranges whose starts are multiples of gop"""
+    gops = math.ceil(n_frames / gop)
+    gops_per_chunk = max(1, math.ceil(gops / chunks))
+    step = gops_per_chunk * gop
+    return [(start, min(start + step, n_frames)) for start in range(0, n_frames, step)]
+
+def _render_chunk(path, first_frame, end_frame, fps, settings, ffmpeg_params):
+    clip = _clip
+    if clip.mask is None:
+        # Same frames as clip.iter_frames(fps=fps, dtype="uint8"), converted in a reused buffer
+        frames = (clip.get_frame(frame_index / fps) for frame_index in range(first_frame, end_frame))
+        encode_video(path, frames, clip.size, fps, settings, extra_args=ffmpeg_params)
+        return path
+    with FFMPEG_VideoWriter(
+        path,
+        clip.size,
+        fps,
+        codec=settings.codec,
+        preset=settings.preset,
+        with_mask=True,
+        threads=settings.threads,
+        ffmpeg_params=settings.ffmpeg_params() + ffmpeg_params,
+    ) as writer:
+        # Same frames as clip.iter_frames(fps=fps, dtype="uint8") in ffmpeg_write_video
+        for frame_index in range(first_frame, end_frame):
+            t = frame_index / fps
+            frame = clip.get_frame(t)
+            if frame.dtype != np.uint8:
+                frame = frame.astype(np.uint8)
+            mask = 255 * clip.mask.get_frame(t)
+            if mask.dtype != np.uint8:
+                mask = mask.astype(np.uint8)
+            writer.write_frame(np.dstack([frame, mask]))
+    return path
+
+def _join_chunks(chunk_paths, audio_path, output_path):
+    """Concatenate the chunks and mux the audio, without re-encoding"""
+    list_path = os.path.join(os.path.dirname(chunk_paths[0]), "chunks.txt")
+    with open(list_path, "w") as list_file:
+        for path in chunk_paths:
+            list_file.write(concat_list_entry(path))
+    concatenate_list_file(list_path, output_path, audio_path)
+
+def write_videofile_chunked(clip, filename, fps=None, workers=None, chunks_per_worker=2, gop=None,
+                            codec="libx264", preset="medium", tune=None, crf=None, threads=None, ffmpeg_params=None,
+                            audio=True, audio_fps=44100, audio_codec="aac", audio_bitrate=None):
+    """
+    Same as clip.write_videofile(filename, ...), rendering time ranges in parallel processes
+
+    Args:
+        clip: Clip to render, usually a CompositeVideoClip
+        filename: Output .mp4 path
+        fps: Frame rate, defaults to the clip's
+        workers: Number of processes, defaults to the number of CPUs
+        chunks_per_worker: Chunks per process, more chunks balance the load better but start more readers
+        gop: Frames between keyframes, chunks start on multiples of it; defaults to 2 seconds
+        codec, preset, threads: Encoder settings, as in write_videofile
+        tune: x264 tune, e.g. "film", see encoding.CONTENT_TYPES
+        crf: Constant rate factor of the encoder, None for ffmpeg's default
+        ffmpeg_params: Extra ffmpeg output parameters
+        audio, audio_fps, audio_codec, audio_bitrate: Audio settings, as in write_videofile
+
+    Needs the "fork" start method (Linux, macOS); elsewhere the clip is
+    written with write_videofile.
+    """
+    global _clip
+    fps = fps or clip.fps
+    workers = workers or os.cpu_count() or 1
+    gop = gop or max(1, int(round(2 * fps)))
+    settings = EncoderSettings(codec=codec, preset=preset, tune=tune, crf=crf, gop=gop, threads=threads)
+    params = list(ffmpeg_params or [])
+    n_frames = int(clip.duration * fps)
+    if n_frames == 0:
+        raise ValueError(f"Can't render {filename}: the clip lasts {clip.duration}s, less than one frame at {fps} fps")
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        print("Chunked rendering needs the fork start method, rendering in a single process")
+        clip.write_videofile(filename, fps=fps, codec=codec, preset=preset, threads=threads,
+                             ffmpeg_params=settings.ffmpeg_params() + params,
+                             audio=audio, audio_fps=audio_fps, audio_codec=audio_codec, audio_bitrate=audio_bitrate)
+        return
+
+    ranges = chunk_ranges(n_frames, gop, workers * chunks_per_worker)
+    work_dir = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(os.path.abspath(filename)))
+    started = time.time()
+    print(f"Rendering {n_frames} frames in {len(ranges)} chunks on {min(workers, len(ranges))} processes...")
+    _clip = clip
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(ranges)), mp_context=context, initializer=_reset_readers
+        ) as pool:
+            futures = {
+                pool.submit(
+                    _render_chunk, os.path.join(work_dir, f"chunk_{index:05d}.mp4"),
+                    first_frame, end_frame, fps, settings, params,
+                ): index
+                for index, (first_frame, end_frame) in enumerate(ranges)
+            }
+
+            # The workers are forked by now, the audio is rendered here meanwhile
+            audio_path = None
+            if audio and clip.audio is not None:
+                audio_path = os.path.join(work_dir, "audio.m4a")
+                clip.audio.write_audiofile(audio_path, fps=audio_fps, codec=audio_codec, bitrate=audio_bitrate,
+                                           logger=None)
+
+            chunk_paths = [None] * len(ranges)
+            for done, future in enumerate(as_completed(futures), start=1):
+                chunk_paths[futures[future]] = future.result()
+                print(f"Chunk {done}/{len(ranges)} done")
+
+        _join_chunks(chunk_paths, audio_path, filename)
+    finally:
+        _clip = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Rendered {filename} in {time.time() - started:.1f}s")
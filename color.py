@@ -0,0 +1,142 @@
+"""
+Color transforms compiled to fused 8-bit passes
+
+Color operations (sepia, grayscale, tint, levels, gamma...) are described as
+either a linear mix of the RGB channels or per-channel curves, then compiled
+into passes working directly on uint8 frames: no float copy of the frame is
+ever made, and consecutive operations of the same kind are fused when that
+gives the same result as applying them one after the other.
+
+Example:
+    sepia_filter = compile_color(sepia())
+    clip = clip.image_transform(sepia_filter)
+"""
+import numpy as np
+from PIL import Image
+
+class Mix:
+    """Linear color operation: out = matrix @ (r, g, b) + offset, clipped to [0, 255]"""
+
+    def __init__(self, matrix, offset=(0, 0, 0)):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(3, 3)
+        self.offset = np.asarray(offset, dtype=np.float64).reshape(3)
+
+    def stays_in_range(self):
+        """True if no input color is clipped: non-negative rows summing to at most 1, no offset"""
+        return bool(np.all(self.matrix >= 0) and np.all(self.matrix.sum(axis=1) <= 1) and not np.any(self.offset))
+
+class Curves:
+    """Per-channel color operation: out[c] = luts[c][in[c]]"""
+
+    def __init__(self, luts):
+        luts = np.asarray(luts)
+        if luts.shape == (256,):
+            luts = np.stack([luts] * 3)
+        self.luts = np.clip(np.round(luts), 0, 255).astype(np.uint8)
+
+def sepia():
+    """Classic sepia tone"""
+    return Mix([[0.393, 0.769, 0.189], [0.349, 0.686, 0.168], [0.272, 0.534, 0.131]])
+
+def grayscale():
+    """Rec. 601 luma on all three channels"""
+    return Mix([[0.299, 0.587, 0.114]] * 3)
+
+def tint(r=1.0, g=1.0, b=1.0):
+    """Multiply each channel by a factor"""
+    return Mix(np.diag([r, g, b]))
+
+def channel_mixer(matrix, offset=(0, 0, 0)):
+    """Any linear mix of the channels"""
+    return Mix(matrix, offset)
+
+def gamma(value, channels=(0, 1, 2)):
+    """Gamma curve, value > 1 brightens the midtones"""
+    values = np.arange(256) / 255
+    luts = np.stack([np.arange(256)] * 3).astype(np.float64)
+    for c in channels:
+        luts[c] = 255 * values ** (1 / value)
+    return Curves(luts)
+
+def levels(in_black=0, in_white=255, gamma_value=1.0, out_black=0, out_white=255):
+    """Photo-editor levels: remap [in_black, in_white] to [out_black, out_white] with a gamma"""
+    values = np.clip((np.arange(256) - in_black) / max(in_white - in_black, 1), 0, 1)
+    return Curves(out_black + (out_white - out_black) * values ** (1 / gamma_value))
+
+def invert():
+    """Negative image"""
+    return Curves(255 - np.arange(256))
+
+class ColorPipeline:
+    """
+    A chain of color operations compiled into as few passes as possible
+
+    Curves become one ``Image.point`` lookup pass and mixes one
+    ``Image.convert`` matrix pass, both done by Pillow in C on the 8-bit
+    image. Consecutive curves are merged into a single lookup table, and a
+    mix into the mix before it when that one never clips (see
+    ``Mix.stays_in_range``), so a chain such as levels + grayscale + sepia
+    runs in two passes while sepia + tint keeps a pass each, as clipping
+    sepia's output changes what tint makes of it. Mix results are clipped
+    and truncated like ``np.clip(x, 0, 255).astype(np.uint8)``; fused mixes
+    skip the truncation in between, so they may differ from separate passes
+    by one level.
+
+    Call it on a frame like any ``image_transform`` function.
+    """
+
+    def __init__(self, *operations):
+        self.operations = list(operations)
+        self.passes = self._compile(self.operations)
+
+    @staticmethod
+    def _compile(operations):
+        # Merge runs of operations of the same kind
+        merged = []
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, (Curves, Mix)):
+                raise TypeError(f"Not a color operation: {operation!r}")
+            previous = merged[-1] if merged else None
+            if isinstance(operation, Curves) and isinstance(previous, Curves):
+                merged[-1] = Curves(np.stack([operation.luts[c][previous.luts[c]] for c in range(3)]))
+            elif isinstance(operation, Mix) and isinstance(previous, Mix) and operations[index - 1].stays_in_range():
+                # The truncation in between lowers previous' output by half a level on average
+                merged[-1] = Mix(
+                    operation.matrix @ previous.matrix,
+                    operation.matrix @ (previous.offset - 0.5) + operation.offset,
+                )
+            else:
+                merged.append(operation)
+
+        passes = []
+        for operation in merged:
+            if isinstance(operation, Curves):
+                passes.append(("point", operation.luts.ravel().tolist()))
+            else:
+                # Pillow rounds to nearest, shift by half a level to truncate instead
+                matrix = np.hstack([operation.matrix, operation.offset[:, None] - 0.5])
+                passes.append(("matrix", tuple(matrix.ravel().tolist())))
+        return passes
+
+    def then(self, *operations):
+        """Return a new pipeline with more operations appended"""
+        return ColorPipeline(*(self.operations + list(operations)))
+
+    def __call__(self, frame):
+        alpha = None
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            frame, alpha = frame[..., :3], frame[..., 3]
+        image = Image.fromarray(np.ascontiguousarray(frame, dtype=np.uint8))
+        for kind, data in self.passes:
+            if kind == "point":
+                image = image.point(data)
+            else:
+                image = image.convert("RGB", data)
+        result = np.asarray(image)
+        if alpha is not None:
+            result = np.dstack([result, alpha])
+        return result
+
+def compile_color(*operations):
+    """Compile color operations into a frame -> frame function"""
+    return ColorPipeline(*operations)
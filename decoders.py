@@ -0,0 +1,148 @@
+"""Shared pool of ffmpeg decoders for cutting many subclips out of the same sources"""
+import copy
+from collections import OrderedDict
+
+from moviepy import VideoFileClip
+from moviepy.tools import convert_to_seconds
+
+from proxies import make_proxy, scale_clip
+
+class DecoderPool:
+    """
+    Give every subclip range of a source video its own ffmpeg reader
+
+    Subclips made with ``VideoFileClip.subclipped`` all share the reader of
+    their source, so compositing two scenes far apart in the file makes that
+    single reader seek back and forth for every frame. Subclips made with
+    ``pool.subclip`` read through a reader dedicated to their range, which
+    moves forward frame by frame as the range plays and is reused by later
+    passes (previews, final render). Readers start with ffmpeg's keyframe seek
+    followed by an accurate seek, like MoviePy's own reader.
+
+    At most ``max_open`` reader processes are kept open; the least recently
+    used one is closed when another is needed, and reopened on demand.
+
+    With a ``proxy_height``, frames are read from low resolution all-intra
+    proxies of the sources (built once, next to them, see proxies.py). Clips
+    keep the size of their source, only their frames are smaller (their
+    ``frame_size()`` tells which are read, see FrameCache): preview
+    them with ``pool.preview(clip)``, which composites at the proxy scale.
+    ``use_proxies(False)`` switches every subclip back to the originals, e.g.
+    before the final render.
+
+    Example:
+        decoders = DecoderPool()
+        intro_clip = decoders.subclip("./resources/bbb.mp4", 1, 11)
+    """
+
+    def __init__(self, max_open=6, proxy_height=None, **clip_kwargs):
+        self.max_open = max_open
+        self.proxy_height = proxy_height
+        self.proxies = bool(proxy_height)
+        self.clip_kwargs = clip_kwargs
+        self._sources = {}
+        self._proxy_sources = {}
+        self._readers = OrderedDict()  # key -> reader, least recently used first
+        self.opened = 0
+        self.evicted = 0
+
+    def source(self, filename):
+        """Return the VideoFileClip of a source, opened once per pool"""
+        if filename not in self._sources:
+            clip = VideoFileClip(filename, **self.clip_kwargs)
+            # The source's own reader only serves as a template for range readers
+            clip.reader.close()
+            self._sources[filename] = clip
+        return self._sources[filename]
+
+    def proxy_source(self, filename):
+        """Return the VideoFileClip of a source's proxy, the source itself if it is no taller than a proxy"""
+        if filename not in self._proxy_sources:
+            source = self.source(filename)
+            if source.size[1] <= self.proxy_height:
+                self._proxy_sources[filename] = source
+            else:
+                clip = VideoFileClip(make_proxy(filename, self.proxy_height), audio=False)
+                clip.reader.close()
+                self._proxy_sources[filename] = clip
+        return self._proxy_sources[filename]
+
+    def use_proxies(self, enabled=True):
+        """Read frames from the proxies (previews, drafts) or from the original sources (final render)"""
+        if enabled and not self.proxy_height:
+            raise ValueError("This DecoderPool has no proxy_height")
+        self.proxies = enabled
+
+    def preview_scale(self):
+        """Scale at which clips reading from this pool should be composited, 1 without proxies, never above 1"""
+        if not self.proxies or not self._sources:
+            return 1
+        return min(1, self.proxy_height / max(clip.size[1] for clip in self._sources.values()))
+
+    def preview(self, clip, **preview_kwargs):
+        """Same as clip.preview(), at the proxy scale when proxies are used"""
+        scale = self.preview_scale()
+        if scale != 1:
+            clip = scale_clip(clip, scale)
+        clip.preview(**preview_kwargs)
+
+    def subclip(self, filename, start_time=0, end_time=None):
+        """Same as VideoFileClip(filename).subclipped(start_time, end_time), with its own reader"""
+        source = self.source(filename)
+        start = convert_to_seconds(start_time)
+        if start < 0:
+            start += source.duration
+        key = (filename, start, end_time)
+        # Frames, including the first one read by subclipped, never come from the closed template reader
+        ranged = source.copy()
+        ranged.frame_function = lambda t: self.read(key, t)
+        clip = ranged.subclipped(start_time, end_time)
+        clip.size = source.size  # Not the size of the first frame, which may come from a proxy
+        clip.frame_size = lambda: self.frame_size(filename)  # Keeps proxy and full frames apart in a FrameCache
+        return clip
+
+    def frame_size(self, filename):
+        """Size of the frames currently read from a source: its proxy's or its own"""
+        return tuple(self.proxy_source(filename).size if self.proxies else self.source(filename).size)
+
+    def read(self, key, t):
+        """Return the frame at source time t from the reader of key"""
+        key = key + (self.proxies,)
+        reader = self._readers.get(key)
+        if reader is None:
+            template = self.proxy_source(key[0]) if self.proxies else self.source(key[0])
+            reader = copy.copy(template.reader)
+            reader.proc = None  # The copy must not share the template's process
+            self._readers[key] = reader
+        self._readers.move_to_end(key)
+
+        if reader.proc is None:
+            self.opened += 1
+            self._evict(keep=key)
+            reader.initialize(t)
+            return reader.last_read
+        return reader.get_frame(t)
+
+    def _evict(self, keep):
+        open_keys = [key for key, reader in self._readers.items() if reader.proc is not None and key != keep]
+        while len(open_keys) >= self.max_open:
+            self._readers[open_keys.pop(0)].close(delete_lastread=False)
+            self.evicted += 1
+
+    def stats(self):
+        """Return the number of open readers and how often readers were (re)opened or evicted"""
+        open_readers = sum(reader.proc is not None for reader in self._readers.values())
+        return {"open": open_readers, "ranges": len(self._readers), "opened": self.opened, "evicted": self.evicted,
+                "proxies": self.proxies}
+
+    def close(self):
+        """Close all readers and sources"""
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+        # A small source is its own proxy, closed once
+        clips = {id(clip): clip for clip in list(self._sources.values()) + list(self._proxy_sources.values())}
+        for clip in clips.values():
+            clip.close()
+        self._sources.clear()
+        self._proxy_sources.clear()
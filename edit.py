@@ -0,0 +1,421 @@
+"""
+Declarative edits: a timeline described in JSON (or YAML), compiled to a render plan
+
+An edit lists its sources and its layers, bottom to top:
+
+    {
+      "fps": 24,
+      "output": {"profile": "1080p", "content": "film"},
+      "sources": {"bbb": "./resources/bbb.mp4"},
+      "layers": [
+        {"id": "intro", "video": "bbb", "from": 1, "to": 11, "effects": [["FadeIn", 1], ["FadeOut", 1]]},
+        {"id": "title", "text": "Presents", "font": "./resources/font/font.ttf", "font_size": 50,
+         "color": "#fff", "start": 3, "duration": 6, "position": ["center", 200],
+         "effects": [["CrossFadeIn", 1], ["CrossFadeOut", 1]]},
+        {"id": "logo", "image": "./resources/logo_bbb.png", "width": 400,
+         "start": "title.start + 2", "end": "title.end"},
+        {"id": "slowmo", "video": "bbb", "from": "04:41.5", "to": "04:44.70", "start": "intro.end - 1",
+         "filters": [["sepia"]], "effects": [["CrossFadeIn", 1], ["MultiplySpeed", 0.5]]}
+      ]
+    }
+
+A layer is a "video" (a source name or path, cut from "from" to "to", with
+"cut" sections removed), an "image" (resized to "width" or "height") or a
+"text". "start", "end" and "duration" are seconds or references to another
+layer such as "intro.end - 1.5". A video lasts as long as its range after
+its effects (slow motion included) unless told otherwise; images and texts
+need an end or a duration. "filters" are color operations of color.py,
+applied before "effects", which are vfx/afx effects by class name
+(CrossFadeIn and CrossFadeOut are timeline.py's). "output" only chooses
+the encoder settings: a render profile's preset and CRF, and the content
+type's tune and GOP (see encoding.encoder_settings); the size and frame
+rate are the edit's own "size" and "fps".
+
+``compile_edit`` resolves the timings, plans the reads of each source
+(layers reading overlapping or nearby ranges of a source, one after the
+other, share one reader and one range of cached frames), compiles each
+layer's filters into one color pipeline (see color.ColorPipeline), fuses
+consecutive speed changes into one, and returns a RenderPlan whose
+``cost()`` predicts the work before rendering:
+
+    plan = compile_edit(load_edit("trailer.json"))
+    print(plan.describe())
+    plan.write("result.mp4")
+
+Usage:
+    python edit.py trailer.json --cost
+    python edit.py trailer.json --output result.mp4
+"""
+import argparse
+import json
+import os
+import re
+from collections import namedtuple
+
+from moviepy import ColorClip, ImageClip, afx, vfx
+from moviepy.tools import convert_to_seconds
+
+import color
+from chunked import write_videofile_chunked
+from decoders import DecoderPool
+from encoding import encoder_settings
+from textcache import TextRasterCache
+from timeline import CrossFadeIn, CrossFadeOut, TimelineCompositeVideoClip
+
+# Color operations usable in "filters"
+FILTERS = {
+    "sepia": color.sepia,
+    "grayscale": color.grayscale,
+    "tint": color.tint,
+    "channel_mixer": color.channel_mixer,
+    "gamma": color.gamma,
+    "levels": color.levels,
+    "invert": color.invert,
+}
+
+# Same as vfx's, but still layers faded with them are blended without recomputing their masks
+_CROSS_FADES = {"CrossFadeIn": CrossFadeIn, "CrossFadeOut": CrossFadeOut}
+
+# Rough seconds per megapixel of each kind of work on one core, see RenderPlan.cost
+COST_MODEL = {
+    "decode": 0.004,
+    "composite": 0.003,
+    "filter": 0.002,
+    "encode": 0.010,
+}
+
+_REFERENCE = re.compile(r"^\s*([A-Za-z_][\w-]*)\.(start|end)\s*(?:([+-])\s*(\d+(?:\.\d*)?|\.\d+)\s*)?$")
+
+# A range of a source read by one reader, for the layers listed
+Read = namedtuple("Read", "source start end layers")
+
+def load_edit(path):
+    """Read an edit from a .json or .yaml file, relative paths are resolved from its directory"""
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML edits needs PyYAML: pip install pyyaml") from None
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    spec.setdefault("base_dir", os.path.dirname(os.path.abspath(path)))
+    return spec
+
+class Layer:
+    """A layer of an edit, with its resolved timing and its clip"""
+
+    def __init__(self, spec, index):
+        self.spec = spec
+        self.id = spec.get("id", f"layer{index}")
+        kinds = [kind for kind in ("video", "image", "text") if kind in spec]
+        if len(kinds) != 1:
+            raise ValueError(f"Layer {self.id!r} needs exactly one of video, image or text")
+        self.kind = kinds[0]
+        self.source = None
+        self.source_start = self.source_end = None
+        self.start = self.end = None
+        self.natural_duration = None  # Of a video after its cuts and effects, when no end or duration is given
+        self.clip = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+class RenderPlan:
+    """
+    A compiled edit: its layers with resolved timings, the reads of its sources and the composited clip
+
+    ``reads_unmerged`` counts the source ranges before merging, for comparison.
+    """
+
+    def __init__(self, layers, reads, reads_unmerged, clip, fps, settings, source_sizes):
+        self.layers = layers
+        self.reads = reads
+        self.reads_unmerged = reads_unmerged
+        self.clip = clip
+        self.fps = fps
+        self.settings = settings
+        self.source_sizes = source_sizes
+
+    def cost(self, model=COST_MODEL):
+        """
+        Predict the work of rendering: frames decoded, pixels composited, filtered and encoded
+
+        Seconds are estimated from ``model`` (seconds per megapixel on one core).
+        """
+        fps = self.fps
+        decoded = sum((read.end - read.start) * fps for read in self.reads)
+        decoded_unmerged = sum((layer.source_end - layer.source_start) * fps for layer in self.layers
+                               if layer.kind == "video")
+        megapixels = {"decode": 0.0, "composite": 0.0, "filter": 0.0}
+        for read in self.reads:
+            w, h = self.source_sizes[read.source]
+            megapixels["decode"] += (read.end - read.start) * fps * w * h / 1e6
+        for layer in self.layers:
+            w, h = layer.clip.size
+            layer_megapixels = layer.duration * fps * w * h / 1e6
+            megapixels["composite"] += layer_megapixels
+            if layer.spec.get("filters"):
+                megapixels["filter"] += layer_megapixels
+        w, h = self.clip.size
+        frames = int(self.clip.duration * fps)
+        megapixels["encode"] = frames * w * h / 1e6
+        seconds = {stage: megapixels[stage] * model[stage] for stage in megapixels}
+        return {
+            "frames": frames,
+            "decoded_frames": int(decoded),
+            "decoded_frames_unmerged": int(decoded_unmerged),
+            "reads": len(self.reads),
+            "reads_unmerged": self.reads_unmerged,
+            "megapixels": megapixels,
+            "seconds": seconds,
+            "total_seconds": sum(seconds.values()),
+        }
+
+    def describe(self):
+        """Timeline, reads and predicted cost as text"""
+        lines = [f"{'layer':>16} {'kind':>6} {'start':>8} {'end':>8}  size"]
+        for layer in self.layers:
+            lines.append(f"{layer.id:>16} {layer.kind:>6} {layer.start:8.2f} {layer.end:8.2f}  "
+                         f"{layer.clip.size[0]}x{layer.clip.size[1]}")
+        lines.append("")
+        for read in self.reads:
+            lines.append(f"read {os.path.basename(read.source)} {read.start:.2f}-{read.end:.2f}s "
+                         f"for {', '.join(read.layers)}")
+        cost = self.cost()
+        lines.append("")
+        lines.append(f"{cost['frames']} frames, {cost['decoded_frames']} decoded "
+                     f"({cost['decoded_frames_unmerged']} without merging reads)")
+        lines.append("predicted: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in cost["seconds"].items())
+                     + f", total {cost['total_seconds']:.1f}s on one core")
+        return "\n".join(lines)
+
+    def write(self, filename, workers=None):
+        """Render the edit to filename, on several processes"""
+        settings = self.settings
+        write_videofile_chunked(
+            self.clip, filename, fps=self.fps, workers=workers, preset=settings.preset, tune=settings.tune,
+            crf=settings.crf, gop=settings.gop, threads=settings.threads,
+        )
+
+def _seconds(value):
+    return convert_to_seconds(value) if value is not None else None
+
+def _effects(specs):
+    """Effect objects of a layer, consecutive speed changes fused into one"""
+    effects = []
+    for spec in specs or []:
+        name, args = spec[0], spec[1:]
+        effect_class = _CROSS_FADES.get(name) or getattr(vfx, name, None) or getattr(afx, name, None)
+        if effect_class is None:
+            raise ValueError(f"Unknown effect {name!r}")
+        if (name == "MultiplySpeed" and len(args) == 1 and effects
+                and isinstance(effects[-1], vfx.MultiplySpeed) and effects[-1].final_duration is None):
+            effects[-1] = vfx.MultiplySpeed(effects[-1].factor * args[0])
+            continue
+        effects.append(effect_class(*args))
+    return effects
+
+def _filter(specs):
+    """Compiled color pipeline of all the color operations of a layer, or None"""
+    if not specs:
+        return None
+    operations = []
+    for spec in specs:
+        name, args = spec[0], spec[1:]
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter {name!r}, choose from {', '.join(FILTERS)}")
+        operations.append(FILTERS[name](*args))
+    return color.compile_color(*operations)
+
+def _video_clip(layer, read_clip, read_start):
+    """Clip of a video layer cut from the clip of a read starting at read_start in the source"""
+    spec = layer.spec
+    clip = read_clip.subclipped(layer.source_start - read_start, layer.source_end - read_start)
+    for cut_start, cut_end in spec.get("cut", []):
+        clip = clip.with_section_cut_out(_seconds(cut_start), _seconds(cut_end))
+    color_filter = _filter(spec.get("filters"))
+    if color_filter is not None:
+        clip = clip.image_transform(color_filter)
+    if spec.get("audio") is False:
+        clip = clip.without_audio()
+    effects = _effects(spec.get("effects"))
+    return clip.with_effects(effects) if effects else clip
+
+def _video_duration(layer):
+    """Duration of a video layer after its cuts and effects, worked out on a stand-in clip without opening the source"""
+    stand_in = ColorClip((1, 1), color=(0, 0, 0), duration=layer.source_end - layer.source_start)
+    return _video_clip(layer, stand_in, layer.source_start).duration
+
+def _still_clip(layer, base_dir, texts):
+    """Clip of an image or text layer, before timing and effects"""
+    spec = layer.spec
+    if layer.kind == "image":
+        clip = ImageClip(os.path.join(base_dir, spec["image"]))
+        if "width" in spec or "height" in spec:
+            clip = clip.resized(width=spec.get("width"), height=spec.get("height"))
+    else:
+        clip = texts.text_clip(
+            font=os.path.join(base_dir, spec["font"]),
+            text=spec["text"],
+            font_size=spec.get("font_size", 50),
+            color=spec.get("color", "black"),
+            text_align=spec.get("text_align", "left"),
+        )
+    color_filter = _filter(spec.get("filters"))
+    return clip.image_transform(color_filter) if color_filter is not None else clip
+
+def _resolve_timings(layers):
+    """Set start and end of every layer, following references between layers"""
+    by_id = {layer.id: layer for layer in layers}
+    resolving = []
+
+    def value(expression, layer, field):
+        if isinstance(expression, (int, float)):
+            return float(expression)
+        match = _REFERENCE.match(expression)
+        if match is None:
+            try:
+                return float(convert_to_seconds(expression))
+            except Exception:
+                raise ValueError(f"Layer {layer.id!r}: can't read {field} {expression!r}, "
+                                 f"expected seconds or e.g. 'intro.end - 1.5'") from None
+        other_id, other_field, sign, offset = match.groups()
+        if other_id not in by_id:
+            raise ValueError(f"Layer {layer.id!r}: {field} refers to unknown layer {other_id!r}")
+        resolve(by_id[other_id])
+        base = getattr(by_id[other_id], other_field)
+        offset = float(offset or 0)
+        return base - offset if sign == "-" else base + offset
+
+    def resolve(layer):
+        if layer.end is not None:
+            return
+        if layer.id in resolving:
+            raise ValueError(f"Timing cycle: {' -> '.join(resolving[resolving.index(layer.id):] + [layer.id])}")
+        resolving.append(layer.id)
+        spec = layer.spec
+        start = value(spec.get("start", 0), layer, "start")
+        if "end" in spec:
+            end = value(spec["end"], layer, "end")
+        elif "duration" in spec:
+            end = start + float(spec["duration"])
+        elif layer.natural_duration is not None:
+            end = start + layer.natural_duration
+        else:
+            raise ValueError(f"Layer {layer.id!r} needs an end or a duration")
+        layer.start, layer.end = start, end
+        resolving.pop()
+
+    for layer in layers:
+        resolve(layer)
+
+def _plan_reads(video_layers, merge_gap):
+    """Group the video layers of each source into reads of merged ranges"""
+    reads = []
+    by_source = {}
+    for layer in video_layers:
+        by_source.setdefault(layer.source, []).append(layer)
+    for source, layers in by_source.items():
+        groups = []
+        for layer in sorted(layers, key=lambda layer: layer.source_start):
+            group = groups[-1] if groups else None
+            # One reader can serve layers that follow each other in the source and on the timeline, in the same
+            # order: a layer played before the ones it follows in the source would make the reader seek back
+            if (group is not None and layer.source_start <= group["end"] + merge_gap
+                    and all(layer.start >= other.end for other in group["layers"])):
+                group["end"] = max(group["end"], layer.source_end)
+                group["layers"].append(layer)
+            else:
+                groups.append({"start": layer.source_start, "end": layer.source_end, "layers": [layer]})
+        reads += [Read(source, group["start"], group["end"], group["layers"]) for group in groups]
+    return reads
+
+def compile_edit(spec, decoders=None, frames=None, texts=None, merge_gap=1.0):
+    """
+    Compile an edit (a dict, see load_edit) into a RenderPlan
+
+    Only the encoder settings come from the edit's "output" profile, the size
+    and frame rate are the edit's "size" and "fps".
+
+    Args:
+        spec: The edit
+        decoders: DecoderPool the sources are read with, a new one by default
+        frames: Optional FrameCache, every read is cached once, shared by the layers it serves
+        texts: TextRasterCache for the text layers, a new one by default
+        merge_gap: Seconds of source two layers' ranges may be apart and still share a read
+    """
+    base_dir = spec.get("base_dir", ".")
+    decoders = decoders or DecoderPool()
+    texts = texts or TextRasterCache()
+    sources = {name: os.path.join(base_dir, path) for name, path in spec.get("sources", {}).items()}
+
+    layers = [Layer(layer_spec, index) for index, layer_spec in enumerate(spec["layers"])]
+    ids = [layer.id for layer in layers]
+    duplicates = sorted({layer_id for layer_id in ids if ids.count(layer_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate layer ids: {', '.join(duplicates)}")
+
+    # The timing needs the duration of the videos after their effects, no frame has to be read for that
+    video_layers = [layer for layer in layers if layer.kind == "video"]
+    for layer in video_layers:
+        layer.source = sources.get(layer.spec["video"], os.path.join(base_dir, layer.spec["video"]))
+        layer.source_start = _seconds(layer.spec.get("from", 0))
+        if "to" in layer.spec:
+            layer.source_end = _seconds(layer.spec["to"])
+        else:
+            layer.source_end = decoders.source(layer.source).duration
+        layer.natural_duration = _video_duration(layer)
+    _resolve_timings(layers)
+
+    reads = _plan_reads(video_layers, merge_gap)
+    for read in reads:
+        read_clip = decoders.subclip(read.source, read.start, read.end)
+        if frames is not None:
+            read_clip = frames.cached(read_clip)
+        for layer in read.layers:
+            layer.clip = _video_clip(layer, read_clip, read.start)
+    reads = [Read(read.source, read.start, read.end, [layer.id for layer in read.layers]) for read in reads]
+
+    clips = []
+    for layer in layers:
+        if layer.kind == "video":
+            clip = layer.clip
+            if layer.duration < clip.duration:
+                clip = clip.with_duration(layer.duration)
+        else:
+            # Fades of still layers depend on their duration, known only now
+            clip = _still_clip(layer, base_dir, texts).with_duration(layer.duration)
+            effects = _effects(layer.spec.get("effects"))
+            if effects:
+                clip = clip.with_effects(effects)
+        clip = clip.with_start(layer.start)
+        if "position" in layer.spec:
+            position = layer.spec["position"]
+            clip = clip.with_position(tuple(position) if isinstance(position, list) else position)
+        layer.clip = clip
+        clips.append(clip)
+
+    size = tuple(spec["size"]) if "size" in spec else None
+    # Opaque, a transparent composite would also composite a mask the mp4 drops
+    composite = TimelineCompositeVideoClip(clips, size=size, bg_color=(0, 0, 0))
+    fps = spec.get("fps") or next((layer.clip.fps for layer in video_layers if layer.clip.fps), 24)
+    output = spec.get("output", {})
+    settings = encoder_settings(output.get("profile"), output.get("content", "video"))
+    source_sizes = {source: decoders.source(source).size for source in {read.source for read in reads}}
+    return RenderPlan(layers, reads, len(video_layers), composite, fps, settings, source_sizes)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile and render a declarative edit")
+    parser.add_argument("edit", help="edit file (.json, or .yaml with PyYAML)")
+    parser.add_argument("--cost", action="store_true", help="print the plan and its predicted cost, don't render")
+    parser.add_argument("--output", default="./result.mp4", help="video file to render")
+    parser.add_argument("--workers", type=int, default=None, help="rendering processes, one per CPU by default")
+    args = parser.parse_args()
+
+    plan = compile_edit(load_edit(args.edit))
+    print(plan.describe())
+    if not args.cost:
+        plan.write(args.output, workers=args.workers)
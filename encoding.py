@@ -0,0 +1,246 @@
+"""
+x264 encoder settings per content type, and encoding of frames piped to ffmpeg
+
+``encoder_settings(profile, content)`` picks the preset and CRF of a render
+profile and the tune and keyframe interval suited to the content:
+
+    settings = encoder_settings("720p", "film", threads=4)
+    write_clip(clip, "out.mp4", settings)
+
+``encode_video`` sends raw frames to ffmpeg's stdin from a single reused
+buffer (frames already in the right layout are written as they are), and
+feeds an audio clip through a second pipe instead of a temporary file.
+"""
+import os
+import subprocess as sp
+import tempfile
+import threading
+from dataclasses import dataclass, replace
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+
+from profiles import get_profile
+
+AUDIO_FPS = 44100
+
+# tune and seconds between keyframes per kind of content
+CONTENT_TYPES = {
+    # Text slides: one still picture per segment
+    "slides": {"tune": "stillimage", "gop_seconds": 10},
+    # Live action footage, e.g. the trailer
+    "film": {"tune": "film", "gop_seconds": 2},
+    # Flat colors and sharp edges, e.g. motion graphics
+    "animation": {"tune": "animation", "gop_seconds": 2},
+    # Anything else, x264's defaults
+    "video": {"tune": None, "gop_seconds": 2},
+}
+
+@dataclass(frozen=True)
+class EncoderSettings:
+    """Video encoder settings, None leaves the choice to the encoder"""
+    codec: str = "libx264"
+    preset: str = "medium"
+    tune: str = None
+    crf: int = 23
+    gop: int = None  # frames between keyframes
+    threads: int = None  # encoder threads, x264 uses 1.5 per CPU by default
+    pix_fmt: str = "yuv420p"
+
+    def ffmpeg_params(self):
+        """Output options other than codec, preset, threads and pixel format, as moviepy's writers take them"""
+        params = []
+        if self.tune:
+            params += ["-tune", self.tune]
+        if self.crf is not None:
+            params += ["-crf", str(self.crf)]
+        if self.gop:
+            params += ["-g", str(self.gop)]
+        return params
+
+    def output_args(self):
+        """All the video output options of an ffmpeg command"""
+        args = ["-c:v", self.codec, "-preset", self.preset, "-pix_fmt", self.pix_fmt]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args + self.ffmpeg_params()
+
+def encoder_settings(profile=None, content="video", **overrides):
+    """
+    Settings for a render profile and a content type (see CONTENT_TYPES)
+
+    Preset, CRF and threads come from the profile, tune and GOP length from
+    the content type; keyword arguments override any field.
+    """
+    profile = get_profile(profile)
+    try:
+        defaults = CONTENT_TYPES[content]
+    except KeyError:
+        raise ValueError(f"Unknown content type {content!r}, choose from {', '.join(CONTENT_TYPES)}") from None
+    settings = EncoderSettings(
+        preset=profile.preset,
+        crf=profile.crf,
+        tune=defaults["tune"],
+        gop=max(1, round(defaults["gop_seconds"] * profile.fps)),
+        threads=profile.threads,
+    )
+    return replace(settings, **overrides)
+
+def _write_frames(stream, frames, size):
+    """Write RGB frames to stream, converting them to uint8 in one reused buffer"""
+    width, height = size
+    buffer = np.empty((height, width, 3), dtype=np.uint8)
+    for frame in frames:
+        if frame.dtype == np.uint8 and frame.shape == buffer.shape and frame.flags.c_contiguous:
+            stream.write(frame)
+        else:
+            # Same truncation as frame.astype(np.uint8)
+            np.copyto(buffer, frame, casting="unsafe")
+            stream.write(buffer)
+
+def _write_audio(fd, audio, fps):
+    """Write an audio clip to a pipe as float32 samples, closing it at the end"""
+    with os.fdopen(fd, "wb") as stream:
+        try:
+            for chunk in audio.iter_chunks(chunksize=fps, fps=fps, quantize=False, logger=None):
+                stream.write(np.ascontiguousarray(chunk, dtype=np.float32))
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg exited early, the error is reported by encode_video
+
+def encode_video(output_path, frames, size, fps, settings=None, duration=None, audio=None, loop_still=False,
+                 pad_audio=False, extra_args=None):
+    """
+    Encode RGB frames piped to ffmpeg into output_path
+
+    Args:
+        output_path: File to write, under a temporary name renamed once complete
+        frames: Iterable of (height, width, 3) frames, of any numeric dtype
+        size: (width, height) of the frames
+        fps: Frame rate
+        settings: EncoderSettings, defaults to EncoderSettings()
+        duration: Length of the output in seconds, by default that of the frames
+        audio: None for no audio track, "silence" for a silent one, the path of
+            an audio file, or a moviepy audio clip, streamed to ffmpeg through a
+            pipe (a temporary file where pipes can't be passed, on Windows)
+        loop_still: frames is a single picture repeated for the whole duration
+        pad_audio: Pad the audio with silence up to the duration
+        extra_args: More output options for ffmpeg
+    """
+    settings = settings or EncoderSettings()
+    width, height = size
+    cmd = [
+        FFMPEG_BINARY, "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", f"{width}x{height}", "-framerate", str(fps),
+        "-i", "-",
+    ]
+
+    audio_fd = None
+    temp_audio_path = None
+    if audio is None:
+        pass
+    elif isinstance(audio, str) and audio == "silence":
+        cmd += ["-f", "lavfi", "-i", f"anullsrc=r={AUDIO_FPS}:cl=stereo"]
+    elif isinstance(audio, (str, os.PathLike)):
+        cmd += ["-i", os.fspath(audio)]
+    elif os.name == "posix":
+        audio_fd, write_fd = os.pipe()
+        cmd += ["-f", "f32le", "-ar", str(AUDIO_FPS), "-ac", str(audio.nchannels), "-i", f"pipe:{audio_fd}"]
+    else:
+        fd, temp_audio_path = tempfile.mkstemp(suffix=".wav", dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        audio.write_audiofile(temp_audio_path, fps=AUDIO_FPS, logger=None)
+        cmd += ["-i", temp_audio_path]
+
+    if loop_still:
+        # Repeat the single input frame until -t cuts the output
+        cmd += ["-vf", "loop=loop=-1:size=1:start=0"]
+    if audio is not None:
+        cmd += ["-map", "0:v", "-map", "1:a"]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.3f}"]
+    cmd += ["-r", str(fps)] + settings.output_args()
+    if audio is not None:
+        cmd += ["-c:a", "aac", "-ar", str(AUDIO_FPS), "-ac", "2"]
+        if pad_audio:
+            cmd += ["-af", "apad"]
+    cmd += list(extra_args or [])
+    tmp_path = os.path.join(os.path.dirname(output_path), ".tmp_" + os.path.basename(output_path))
+    cmd.append(tmp_path)
+
+    popen_params = {"stdin": sp.PIPE, "stdout": sp.DEVNULL, "stderr": sp.PIPE}
+    if audio_fd is not None:
+        popen_params["pass_fds"] = (audio_fd,)
+    audio_thread = None
+    try:
+        proc = sp.Popen(cmd, **cross_platform_popen_params(popen_params))
+        if audio_fd is not None:
+            os.close(audio_fd)
+            audio_fd = None
+            audio_thread = threading.Thread(
+                target=_write_audio, args=(write_fd, audio, AUDIO_FPS), name="audio-pipe", daemon=True
+            )
+            audio_thread.start()
+            write_fd = None
+        try:
+            try:
+                _write_frames(proc.stdin, frames, size)
+            except (BrokenPipeError, OSError):
+                pass  # ffmpeg exited early, the error is reported below
+            finally:
+                proc.stdin.close()
+        except BaseException:
+            # The frames failed (or the render was interrupted): stop ffmpeg and drop its partial output
+            proc.kill()
+            proc.stderr.close()
+            proc.wait()
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        error = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    finally:
+        if audio_fd is not None:
+            os.close(audio_fd)
+            os.close(write_fd)
+        if audio_thread is not None:
+            audio_thread.join()
+        if temp_audio_path is not None:
+            os.unlink(temp_audio_path)
+    if returncode != 0:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise IOError(f"Could not encode {output_path}: {error.decode(errors='replace')}")
+    os.replace(tmp_path, output_path)
+
+def concat_list_entry(path):
+    """Line of an ffmpeg concat list for a file"""
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+def concatenate_list_file(list_path, output_path, audio_path=None):
+    """Join the files listed in an ffmpeg concat list without re-encoding, muxing audio_path if given"""
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", output_path]
+    proc = sp.run(cmd, **cross_platform_popen_params(
+        {"stdin": sp.DEVNULL, "stdout": sp.DEVNULL, "stderr": sp.PIPE}
+    ))
+    if proc.returncode != 0:
+        raise IOError(f"Could not concatenate into {output_path}: {proc.stderr.decode(errors='replace')}")
+
+def write_clip(clip, output_path, settings=None, fps=None, audio=True):
+    """Same as clip.write_videofile(output_path, ...) with encoder settings, the audio piped from memory"""
+    fps = fps or clip.fps
+    encode_video(
+        output_path,
+        clip.iter_frames(fps=fps),
+        clip.size,
+        fps,
+        settings,
+        duration=clip.duration,
+        audio=clip.audio if audio else None,
+    )
@@ -0,0 +1,195 @@
+"""Memory-bounded frame cache for re-previewing clips that didn't change"""
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Times are keyed in microseconds so float noise in t never causes a miss
+TIME_TICKS = 1_000_000
+
+class FrameCache:
+    """
+    Cache the frames of clips across previews and renders
+
+    ``cache.cached(clip)`` returns a copy of the clip reading its frames (and
+    its mask's) through the cache. Only the frames of the clips passed to
+    ``cached`` are kept, usually decoded scenes: a layer is identified by its
+    frame function, so ``with_*`` methods that don't touch the pixels (start,
+    position, mask effects) keep reading the cached frames, while transforms
+    that do (time cuts, speed, filters, effects, composites) build a new
+    function on top of the cached one, computed again on every preview with
+    only the decoding underneath coming from the cache. Entries are keyed by (layer, frame size, t), the frame
+    size being that of the frames read when the clip has a ``frame_size()``
+    (DecoderPool subclips, whose frames come from proxies or not); t is exact to
+    the microsecond, so previews at different fps share the frames they have
+    in common.
+
+    Frames are kept in memory up to ``max_bytes``, least recently used first
+    out. With a ``spill_dir``, evicted frames are written there as .npy files
+    (up to ``max_spill_bytes``) and read back on the next hit instead of
+    being decoded again. Spill files are named after the process writing
+    them, so forked processes sharing the directory never read or remove
+    each other's. Pass ``spill_dir=True`` for a temporary directory
+    removed by ``close``.
+
+    ``disable()`` turns the cache into a pass-through, e.g. before a render
+    that reads every frame once (and in forked processes).
+
+    Example:
+        frames = FrameCache(max_bytes=2 * 1024**3)
+        intro_clip = frames.cached(intro_clip)
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024, spill_dir=None, max_spill_bytes=4 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self._own_spill_dir = spill_dir is True
+        if spill_dir is True:
+            spill_dir = tempfile.mkdtemp(prefix="frames_")
+        elif spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir or None
+
+        self._frames = OrderedDict()  # key -> frame, least recently used first
+        self._spilled = OrderedDict()  # key -> (path, nbytes)
+        self._spill_count = 0
+        self._lock = threading.Lock()
+        self.enabled = True
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cached(self, clip):
+        """Return a copy of the clip (and its mask) reading frames through the cache"""
+        new_clip = clip.with_updated_frame_function(
+            self._wrap(clip.frame_function, getattr(clip, "frame_size", None) or (lambda: clip.size))
+        )
+        new_clip.size = clip.size  # Frames may be smaller than the clip when read from proxies
+        if clip.mask is not None:
+            mask = clip.mask
+            new_clip.mask = mask.with_updated_frame_function(self._wrap(mask.frame_function, lambda: mask.size))
+            new_clip.mask.size = clip.mask.size
+        return new_clip
+
+    def _wrap(self, frame_function, frame_size):
+        # The function itself is part of the keys: it stays alive as long as its frames are cached
+        def cached_frame_function(t):
+            return self.get_frame(frame_function, t, frame_size())
+
+        return cached_frame_function
+
+    def get_frame(self, frame_function, t, size=None):
+        """Return frame_function(t), from the cache when possible"""
+        if not self.enabled:
+            return frame_function(t)
+        key = (frame_function, tuple(size) if size else None, round(t * TIME_TICKS))
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            frame = self._unspill(key)
+            if frame is not None:
+                self.spill_hits += 1
+                self._store(key, frame)
+                return frame
+            self.misses += 1
+
+        frame = np.asarray(frame_function(t))
+        frame.flags.writeable = False  # Shared by every later hit
+        with self._lock:
+            self._store(key, frame)
+        return frame
+
+    def _store(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        self._frames[key] = frame
+        self.bytes += frame.nbytes
+        while self.bytes > self.max_bytes:
+            old_key, old_frame = self._frames.popitem(last=False)
+            self.bytes -= old_frame.nbytes
+            self.evictions += 1
+            self._spill(old_key, old_frame)
+
+    def _spill(self, key, frame):
+        if not self.spill_dir or frame.nbytes > self.max_spill_bytes:
+            return
+        self._spill_count += 1
+        # A forked process inherits the counter, the pid keeps its files apart
+        pid = os.getpid()
+        path = os.path.join(self.spill_dir, f"{pid}_{self._spill_count}.npy")
+        np.save(path, frame)
+        self._spilled[key] = (path, frame.nbytes, pid)
+        self.spill_bytes += frame.nbytes
+        while self.spill_bytes > self.max_spill_bytes:
+            _, (old_path, nbytes, old_pid) = self._spilled.popitem(last=False)
+            self.spill_bytes -= nbytes
+            _remove_spilled(old_path, old_pid)
+
+    def _unspill(self, key):
+        # Spilled frame of key, or None if it isn't on disk (anymore)
+        if key not in self._spilled:
+            return None
+        path, nbytes, pid = self._spilled.pop(key)
+        self.spill_bytes -= nbytes
+        try:
+            frame = np.load(path)
+        except FileNotFoundError:
+            return None  # Removed by the process that wrote it
+        _remove_spilled(path, pid)
+        frame.flags.writeable = False
+        return frame
+
+    def stats(self):
+        """Return hit/miss counters and memory/disk usage, to size the cache"""
+        lookups = self.hits + self.spill_hits + self.misses
+        return {
+            "hits": self.hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.spill_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "frames": len(self._frames),
+            "bytes": self.bytes,
+            "spilled_frames": len(self._spilled),
+            "spill_bytes": self.spill_bytes,
+        }
+
+    def clear(self):
+        """Drop every cached frame, in memory and on disk"""
+        with self._lock:
+            self._frames.clear()
+            for path, _, pid in self._spilled.values():
+                _remove_spilled(path, pid)
+            self._spilled.clear()
+            self.bytes = 0
+            self.spill_bytes = 0
+
+    def disable(self):
+        """Clear the cache and read frames straight from their clips from now on"""
+        with self._lock:
+            self.enabled = False
+        self.clear()
+
+    def close(self):
+        """Clear the cache and remove the temporary spill directory, if any"""
+        self.clear()
+        if self._own_spill_dir and self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+def _remove_spilled(path, pid):
+    """Remove a spill file written by this process; files inherited from the parent are left to it"""
+    if pid != os.getpid():
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,47 +1,70 @@
 from moviepy import *
-from gtts import gTTS
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from assets import AssetCache, font_file, load_background, load_font
+from encoding import concat_list_entry, encode_video, encoder_settings, write_clip
+import encoding
+from profiles import get_profile
+from textcache import rasterize_text
+from tracing import segment_profile, span, timed_frames, traced, use_tracer
+import tracing
+from tts import AudioCache, SpeechPipeline
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import asdict
+import hashlib
+import json
+import numpy as np
 import os
+import shutil
 import tempfile
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from PIL import Image, ImageDraw
 
-def create_text_overlay(text, bg_size, font_path="Arial.ttf", font_size=48, text_color=(255, 255, 255)):
-    """Create a text overlay image with proper text wrapping and positioning"""
+# Font used for the script segments
+SEGMENT_FONT_PATH = "Arial.ttf"
+SEGMENT_FONT_SIZE = 60  # Larger font for better readability
+
+@traced("overlay")
+def create_text_overlay(text, bg_size, font_path="Arial.ttf", font_size=48, text_color=(255, 255, 255), assets=None):
+    """
+    Create a text overlay image with proper text wrapping and positioning
+
+    font_size and margins are given for a 1080p frame and scaled to bg_size.
+    """
     # Create transparent image for text overlay
     overlay = Image.new("RGBA", bg_size, (0, 0, 0, 0))
     draw = ImageDraw.Draw(overlay)
     
-    try:
-        font = ImageFont.truetype(font_path, size=font_size)
-    except (OSError, IOError):
-        # Fallback to default font if custom font not found
-        try:
-            font = ImageFont.load_default()
-            print(f"Warning: Could not load font {font_path}, using default font")
-        except:
-            font = ImageFont.load_default()
+    # Keep the same layout whatever the resolution
+    scale = bg_size[1] / 1080
+    font_size = max(1, round(font_size * scale))
     
     # Wrap text to fit the image width
-    max_width = bg_size[0] - 100  # Leave 50px margin on each side
+    max_width = bg_size[0] - round(100 * scale)  # Leave 50px margin on each side
     
     # Estimate characters per line based on average character width
-    avg_char_width = font.getbbox("A")[2]  # Width of 'A' character
-    chars_per_line = max_width // avg_char_width
-    
-    # Wrap the text
-    wrapped_text = textwrap.fill(text, width=int(chars_per_line * 0.8))
+    if assets is not None:
+        char_width = assets.text.char_width(font_path, font_size, "A")
+    else:
+        font = load_font(font_path, font_size)
+        char_width = font.getbbox("A")[2]
+    avg_char_width = max(char_width, 1)  # Width of 'A' character
+    chars_per_line = max(max_width // avg_char_width, 2)
+    wrap_width = int(chars_per_line * 0.8)
     
-    # Get text bounding box
-    bbox = draw.multiline_textbbox((0, 0), wrapped_text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
+    # Wrap and rasterize the text, once per distinct text when the job's caches are available
+    if assets is not None:
+        text_raster = assets.text.render(text, font_path, font_size, text_color, "center", wrap_width)
+    else:
+        text_raster = rasterize_text(text, font, text_color, "center", wrap_width)
+    text_width, text_height = text_raster.size
     
     # Center the text
     x = (bg_size[0] - text_width) // 2
     y = (bg_size[1] - text_height) // 2
     
     # Add semi-transparent background for better readability
-    padding = 20
+    padding = round(20 * scale)
     bg_rect = [
         x - padding, 
         y - padding, 
@@ -50,55 +73,75 @@ def create_text_overlay(text, bg_size, font_path="Arial.ttf", font_size=48, text
     ]
     draw.rectangle(bg_rect, fill=(0, 0, 0, 128))  # Semi-transparent black
     
-    # Draw the text
-    draw.multiline_text((x, y), wrapped_text, font=font, fill=text_color, align="center")
+    # Draw the text: its color through its coverage, like draw.multiline_text does
+    ink = text_raster.color + (255,)
+    offset_x, offset_y = text_raster.offset
+    overlay.paste(ink, (x + offset_x, y + offset_y), Image.fromarray(text_raster.alpha))
     
     return overlay
 
-def make_clip(text, duration, bg_image_path, font_path="Arial.ttf", font_size=48):
-    """Create a video clip with text overlay on background image"""
-    
-    # Load and prepare background image
-    try:
-        bg_image = Image.open(bg_image_path).convert("RGB")
-    except Exception as e:
-        print(f"Error loading background image {bg_image_path}: {e}")
-        # Create a default background
-        bg_image = Image.new("RGB", (1920, 1080), (50, 50, 50))
+@traced("make_clip")
+def make_clip(text, duration, bg_image_path, font_path="Arial.ttf", font_size=48, assets=None, size=(1920, 1080)):
+    """
+    Create a video clip with text overlay on background image
+
+    Pass the job's AssetCache as assets so the background is decoded and
+    resized, and the font loaded, only once for all the segments. size is the
+    output resolution, font_size is given for 1080p and scaled to it.
+    """
     
-    # Resize to standard video dimensions if needed
-    target_size = (1920, 1080)
-    bg_image = bg_image.resize(target_size, Image.Resampling.LANCZOS)
+    # Load and prepare background image, resized to the output dimensions
+    target_size = tuple(size)
+    if assets is not None:
+        bg_frame = assets.background(bg_image_path, target_size)
+    else:
+        bg_frame = np.asarray(load_background(bg_image_path, target_size))
     
     # Create text overlay
-    text_overlay = create_text_overlay(text, target_size, font_path, font_size)
-    
-    # Composite the images
-    final_image = Image.alpha_composite(bg_image.convert("RGBA"), text_overlay)
-    final_image = final_image.convert("RGB")
-    
-    # Save temporary image
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        temp_image_path = tmp.name
-        final_image.save(temp_image_path)
+    text_overlay = create_text_overlay(text, target_size, font_path, font_size, assets=assets)
     
-    # Create MoviePy clip
-    video_clip = ImageClip(temp_image_path).with_duration(duration)
-    
-    # Clean up temporary file
-    os.unlink(temp_image_path)
+    # Composite the images in memory and hand the frame straight to MoviePy
+    frame = composite_overlay(bg_frame, text_overlay)
+    return ImageClip(frame).with_duration(duration)
+
+@traced("overlay.composite")
+def composite_overlay(bg_frame, overlay):
+    """
+    Alpha-blend an RGBA overlay image onto an RGB frame, returns a new frame
+
+    Only the bounding box of the overlay's visible pixels is blended, the rest
+    of the frame is a plain copy of the background.
+    """
+    frame = bg_frame.copy()
+    box = overlay.getchannel("A").getbbox()
+    if box is None:
+        return frame
     
-    return video_clip
+    left, top, right, bottom = box
+    region = np.asarray(overlay.crop(box))
+    alpha = region[:, :, 3:].astype(np.uint16)
+    target = frame[top:bottom, left:right]
+    # Same rounding as PIL's alpha_composite over an opaque background
+    target[...] = (region[:, :, :3] * alpha + target * (255 - alpha) + 127) // 255
+    return frame
 
-def generate_audio_for_text(text, output_path, lang="en", slow=False):
-    """Generate TTS audio for given text"""
+@traced("tts.get")
+def get_audio_for_text(text, tts_cache, lang="en", slow=False):
+    """Return the path of the cached TTS audio for text, or None if TTS failed"""
     try:
-        tts = gTTS(text=text, lang=lang, slow=slow)
-        tts.save(output_path)
-        return True
+        return tts_cache.get(text, lang=lang, slow=slow)
     except Exception as e:
         print(f"Error generating TTS for text: {e}")
-        return False
+        return None
+
+@traced("tts.wait")
+def wait_for_audio(future):
+    """Return the audio path of a SpeechPipeline future, or None if TTS failed"""
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Error generating TTS for text: {e}")
+        return None
 
 def estimate_speech_duration(text, words_per_minute=150):
     """Estimate duration based on text length and speaking speed"""
@@ -106,108 +149,588 @@ def estimate_speech_duration(text, words_per_minute=150):
     duration = (word_count / words_per_minute) * 60
     return max(duration, 2.0)  # Minimum 2 seconds
 
-def create_text_to_video(script_data, bg_image_path="bg_generic.jpg", output_path="tutorial.mp4"):
+def normalize_segment(item):
+    """
+    Return the (text, duration) of a script item
+
+    An item is a text (its duration is estimated), a (text, duration) pair
+    or a {"text": ..., "duration": ...} dict; a missing or null duration is
+    estimated.
+    """
+    if isinstance(item, str):
+        text_chunk, duration = item, None
+    elif isinstance(item, dict):
+        text_chunk, duration = item["text"], item.get("duration")
+    else:
+        text_chunk, duration = item
+    if duration is None:
+        duration = estimate_speech_duration(text_chunk)
+    return text_chunk, duration
+
+def iter_script(script_data):
+    """Lazily normalize the items of any iterable of script items, see normalize_segment"""
+    for item in script_data:
+        yield normalize_segment(item)
+
+def iter_script_jsonl(script_path):
+    """Read a JSONL script one line (one item) at a time, without loading the whole file"""
+    with open(script_path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# Optional semaphore limiting how many encoders run at once, shared by all the
+# processes of a batch (see batch.py)
+_encoder_slots = None
+
+def set_encoder_slots(semaphore):
+    """Limit concurrent encoders to the slots of a (multiprocessing) semaphore, None to disable"""
+    global _encoder_slots
+    _encoder_slots = semaphore
+
+@contextmanager
+def encoder_slot():
+    """Hold one encoder slot while an encoder runs"""
+    if _encoder_slots is None:
+        yield
+        return
+    with span("encode.wait_slot"):
+        _encoder_slots.acquire()
+    try:
+        yield
+    finally:
+        _encoder_slots.release()
+
+def is_static_clip(clip):
+    """Return True if the clip shows the same picture for its whole duration"""
+    # ImageClip always returns the same array; a mask could still animate, so
+    # masked clips go through the regular per-frame path
+    return isinstance(clip, ImageClip) and clip.mask is None
+
+def segment_encoder_settings(profile, static, duration=None):
+    """Encoder settings of a segment: the stillimage tune for static clips, one keyframe per segment"""
+    profile = get_profile(profile)
+    content = "slides" if static else "video"
+    if duration is None:
+        return encoder_settings(profile, content)
+    return encoder_settings(profile, content, gop=int(duration * profile.fps) + 1)
+
+def encode_segment(clip, output_path, audio_path=None, profile=None):
+    """
+    Encode one segment to its own file with the settings shared by all segments
+
+    Static clips are sent to ffmpeg as a single frame which is looped for the
+    whole duration, with one keyframe per segment, so the picture is composited
+    and converted only once. Other clips have every frame piped through.
+    Every segment gets an AAC stereo track (silence if there is no audio) so
+    the files can later be joined by stream copy. The file is written under a
+    temporary name and renamed, so output_path never holds a partial segment.
+    The frame rate and x264 preset/CRF come from the render profile, static
+    clips are encoded with the stillimage tune.
+    """
+    profile = get_profile(profile)
+    fps = profile.fps
+    duration = clip.duration
+    static = is_static_clip(clip)
+    settings = segment_encoder_settings(profile, static, duration)
+    frames = [clip.get_frame(0)] if static else clip.iter_frames(fps=fps)
+
+    with encoder_slot(), span("encode", frames=int(duration * fps), static=static):
+        encode_video(
+            output_path,
+            frames,
+            clip.size,
+            fps,
+            settings,
+            duration=duration,
+            audio=audio_path or "silence",
+            loop_still=static,
+            pad_audio=True,
+        )
+
+@traced("concatenate")
+def concatenate_list_file(list_path, output_path):
+    """Join the segment files listed in an ffmpeg concat list without re-encoding"""
+    encoding.concatenate_list_file(list_path, output_path)
+
+def concatenate_segment_files(segment_paths, output_path):
+    """Join segment files encoded with identical settings without re-encoding"""
+    list_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", dir=list_dir, delete=False) as list_file:
+        for path in segment_paths:
+            list_file.write(concat_list_entry(path))
+    try:
+        concatenate_list_file(list_file.name, output_path)
+    finally:
+        os.unlink(list_file.name)
+
+def attach_audio(i, video_clip, duration, audio_path, with_audio=False):
+    """
+    Extend a segment clip to fit its TTS audio when available
+
+    The segment encoders take the audio file itself, so the clip only gets
+    an AudioFileClip (an open ffmpeg reader, closed with the clip) with
+    with_audio, for the compose mode which mixes the clips' audio.
+    Returns the clip and the audio path, or None if TTS failed
+    """
+    if audio_path:
+        # Read the audio duration from the file's header, no reader is kept open
+        actual_duration = ffmpeg_parse_infos(audio_path)["duration"]
+        
+        # Use actual audio duration if it's longer than estimated
+        final_duration = max(duration, actual_duration)
+        clip = video_clip.with_duration(final_duration)
+        if with_audio:
+            clip = clip.with_audio(AudioFileClip(audio_path))
+        return clip, audio_path
+    
+    # If TTS fails, keep a video-only clip
+    print(f"TTS failed for segment {i+1}, creating video-only clip")
+    return video_clip, None
+
+def build_segment(i, text_chunk, duration, bg_image_path, tts_cache, assets=None, profile=None):
+    """
+    Build the clip of one script segment, with its TTS audio when available
+
+    Returns the clip and the audio path, or None if TTS failed
+    """
+    audio_path = get_audio_for_text(text_chunk, tts_cache)
+    video_clip = make_clip(
+        text_chunk,
+        duration,
+        bg_image_path,
+        font_path=SEGMENT_FONT_PATH,
+        font_size=SEGMENT_FONT_SIZE,
+        assets=assets,
+        size=get_profile(profile).size
+    )
+    return attach_audio(i, video_clip, duration, audio_path)
+
+def build_clips(segments, total, bg_image_path, tts_cache, assets, max_tts_in_flight=8, profile=None):
+    """
+    Build the clips of (index, text, duration) segments with their TTS audio, for the compose mode to mix
+
+    All the speech is requested up front and the overlays are rendered while
+    the TTS requests are in flight; each clip gets its audio as soon as it
+    arrives. Returns the clips and their audio paths (None if TTS failed).
+    """
+    clips = [None] * len(segments)
+    audio_paths = [None] * len(segments)
+    try:
+        with SpeechPipeline(tts_cache, max_in_flight=max_tts_in_flight) as speech:
+            audio_futures = {
+                speech.submit(text_chunk): n
+                for n, (_, text_chunk, _) in enumerate(segments)
+            }
+            
+            video_clips = []
+            for i, text_chunk, duration in segments:
+                print(f"Processing segment {i+1}/{total}: {text_chunk[:50]}...")
+                with segment_profile(i):
+                    video_clips.append(make_clip(
+                        text_chunk,
+                        duration,
+                        bg_image_path,
+                        font_path=SEGMENT_FONT_PATH,
+                        font_size=SEGMENT_FONT_SIZE,
+                        assets=assets,
+                        size=get_profile(profile).size
+                    ))
+            
+            # Assemble segments in whatever order their audio arrives
+            for future in as_completed(audio_futures):
+                n = audio_futures[future]
+                i, _, duration = segments[n]
+                clips[n], audio_paths[n] = attach_audio(
+                    i, video_clips[n], duration, wait_for_audio(future), with_audio=True
+                )
+    except BaseException:
+        close_clips(clips)
+        raise
+    return clips, audio_paths
+
+def close_clips(clips):
+    """Close clips to free memory, ignoring the ones that failed to build"""
+    for clip in clips:
+        try:
+            clip.close()
+        except:
+            pass
+
+def segment_input_hash(text_chunk, duration, bg_image_path, tts_cache, profile):
+    """Hash every input the encoded segment depends on"""
+    def file_stamp(path):
+        try:
+            stat = os.stat(path)
+            return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            return [path, None, None]
+    
+    # The file the font name resolves to, in the system font directories for a bare name like Arial.ttf
+    segment_font = font_file(SEGMENT_FONT_PATH)
+    payload = json.dumps({
+        "text": text_chunk,
+        "duration": duration,
+        "background": file_stamp(bg_image_path),
+        "font": file_stamp(segment_font) if segment_font else None,
+        "font_size": SEGMENT_FONT_SIZE,
+        "tts": tts_cache.key(text_chunk),
+        "profile": [profile.size, profile.fps],
+        # Settings of both kinds of segments, the GOP length follows from the duration
+        "encoder": [asdict(segment_encoder_settings(profile, static)) for static in (True, False)],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def read_manifest(manifest_path):
+    """Return the segment entries of a build manifest, or [] if there is none"""
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)["segments"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+def write_manifest(manifest_path, entries):
+    """Atomically replace the build manifest"""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"segments": entries}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+# Assets of the current worker process, shared by all the segments it renders
+_worker_assets = None
+
+def _init_worker_assets():
+    global _worker_assets
+    _worker_assets = AssetCache()
+
+def without_speech_path(segment_path):
+    """Name of a segment file encoded without its speech, never reused by incremental renders"""
+    base, ext = os.path.splitext(segment_path)
+    return base + ".no-tts" + ext
+
+def render_segment_file(i, text_chunk, duration, bg_image_path, segment_path, tts_cache, profile):
+    """
+    Build and encode one segment into segment_path
+
+    Returns the path of the file, see without_speech_path if TTS failed
+    """
+    clip, segment_audio = build_segment(i, text_chunk, duration, bg_image_path, tts_cache, assets=_worker_assets, profile=profile)
+    if segment_audio is None:
+        segment_path = without_speech_path(segment_path)
+    try:
+        encode_segment(clip, segment_path, segment_audio, profile=profile)
+    finally:
+        clip.close()
+    return segment_path
+
+def render_segments_parallel(segments, segment_paths, bg_image_path, tts_cache, profile, workers=None):
+    """
+    Render (index, text, duration) segments to segment_paths in worker processes
+
+    Returns {index: path} of the files written, see render_segment_file.
+    If any segment fails the remaining ones are cancelled.
+    """
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_assets) as pool:
+        futures = {
+            pool.submit(render_segment_file, i, text_chunk, duration, bg_image_path, segment_paths[i], tts_cache, profile): i
+            for i, text_chunk, duration in segments
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                rendered[futures[future]] = future.result()
+                print(f"Rendered {done}/{len(futures)} segments")
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return rendered
+
+def render_segments_serial(segments, segment_paths, total, bg_image_path, tts_cache, assets, profile, max_tts_in_flight=8):
+    """
+    Render (index, text, duration) segments to segment_paths in this process, returns {index: path} as render_segments_parallel
+
+    All the speech is requested up front, and each segment is built, encoded
+    and closed before the next one, so only one clip (and its audio) is open
+    at a time whatever the length of the script.
+    """
+    rendered = {}
+    with SpeechPipeline(tts_cache, max_in_flight=max_tts_in_flight) as speech:
+        audio_futures = [speech.submit(text_chunk) for _, text_chunk, _ in segments]
+        for (i, text_chunk, duration), future in zip(segments, audio_futures):
+            print(f"Processing segment {i+1}/{total}: {text_chunk[:50]}...")
+            with segment_profile(i):
+                video_clip = make_clip(
+                    text_chunk,
+                    duration,
+                    bg_image_path,
+                    font_path=SEGMENT_FONT_PATH,
+                    font_size=SEGMENT_FONT_SIZE,
+                    assets=assets,
+                    size=profile.size
+                )
+                clip, audio_path = attach_audio(i, video_clip, duration, wait_for_audio(future))
+                rendered[i] = segment_paths[i] if audio_path else without_speech_path(segment_paths[i])
+                try:
+                    encode_segment(clip, rendered[i], audio_path, profile=profile)
+                finally:
+                    clip.close()
+    return rendered
+
+def write_segmented_video(processed_script, bg_image_path, output_path, tts_cache, assets, profile=None,
+                          parallel=False, workers=None, incremental=False, max_tts_in_flight=8):
+    """
+    Encode each segment to its own file, then stream-copy them into output_path
+
+    Segments are joined in script order. Without incremental the segment files
+    live in a temporary directory removed once done, whether the render
+    succeeds or not. With incremental they are kept in output_path.segments,
+    named by the hash of their inputs and listed in output_path.manifest.json,
+    so the next render only rebuilds the segments whose inputs changed.
+    Segments whose speech failed are left out of the manifest and deleted,
+    so the next render tries their TTS again.
+    """
+    profile = get_profile(profile)
+    total = len(processed_script)
+    if total == 0:
+        raise ValueError("The script has no segments")
+    if incremental:
+        segment_dir = output_path + ".segments"
+        manifest_path = output_path + ".manifest.json"
+        os.makedirs(segment_dir, exist_ok=True)
+        hashes = [
+            segment_input_hash(text_chunk, duration, bg_image_path, tts_cache, profile)
+            for text_chunk, duration in processed_script
+        ]
+        segment_paths = [os.path.join(segment_dir, f"{h}.mp4") for h in hashes]
+    else:
+        segment_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+        segment_paths = [os.path.join(segment_dir, f"segment_{i:05d}.mp4") for i in range(total)]
+    
+    try:
+        # Only render segments that are not on disk yet, once per distinct file
+        dirty = {}
+        for i, ((text_chunk, duration), path) in enumerate(zip(processed_script, segment_paths)):
+            if path not in dirty and not os.path.exists(path):
+                dirty[path] = (i, text_chunk, duration)
+        dirty = list(dirty.values())
+        if incremental:
+            print(f"{len(dirty)}/{total} segments need rendering")
+        
+        if parallel:
+            rendered = render_segments_parallel(dirty, segment_paths, bg_image_path, tts_cache, profile, workers=workers)
+        else:
+            rendered = render_segments_serial(dirty, segment_paths, total, bg_image_path, tts_cache, assets, profile,
+                                              max_tts_in_flight=max_tts_in_flight)
+        # Segments without their speech were written under another name, for every index sharing their file
+        renamed = {segment_paths[i]: path for i, path in rendered.items() if path != segment_paths[i]}
+        segment_paths = [renamed.get(path, path) for path in segment_paths]
+        concatenate_segment_files(segment_paths, output_path)
+        
+        if incremental:
+            # Drop the files of segments that are no longer in the script
+            entries = [
+                {"hash": h, "file": os.path.basename(path), "text": text_chunk, "duration": duration}
+                for h, path, (text_chunk, duration) in zip(hashes, segment_paths, processed_script)
+                if path not in renamed.values()
+            ]
+            current = {entry["file"] for entry in entries}
+            for entry in read_manifest(manifest_path):
+                if entry["file"] not in current:
+                    try:
+                        os.unlink(os.path.join(segment_dir, entry["file"]))
+                    except OSError:
+                        pass
+            write_manifest(manifest_path, entries)
+    finally:
+        if not incremental:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        else:
+            for name in os.listdir(segment_dir):
+                if name.endswith(".no-tts.mp4"):
+                    os.unlink(os.path.join(segment_dir, name))
+
+def write_streamed_video(script, bg_image_path, output_path, tts_cache, assets, profile=None, max_tts_in_flight=8):
+    """
+    Render segments one at a time as they are read from any iterable, then stream-copy them into output_path
+
+    Speech is requested for at most max_tts_in_flight upcoming segments.
+    Each segment is encoded to a file as soon as its audio is ready and its
+    clip closed right away, and only its file name is kept (in the concat
+    list on disk), so memory use doesn't depend on the length of the script.
+    """
+    profile = get_profile(profile)
+    segment_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+    list_path = os.path.join(segment_dir, "segments.txt")
+    pending = deque()  # (index, text, duration, audio future) of the segments waiting for their speech
+    count = 0
+    
+    def flush_oldest():
+        i, text_chunk, duration, future = pending.popleft()
+        print(f"Processing segment {i+1}: {text_chunk[:50]}...")
+        with segment_profile(i):
+            video_clip = make_clip(
+                text_chunk,
+                duration,
+                bg_image_path,
+                font_path=SEGMENT_FONT_PATH,
+                font_size=SEGMENT_FONT_SIZE,
+                assets=assets,
+                size=profile.size
+            )
+            clip, audio_path = attach_audio(i, video_clip, duration, wait_for_audio(future))
+            try:
+                segment_path = os.path.join(segment_dir, f"segment_{i:05d}.mp4")
+                encode_segment(clip, segment_path, audio_path, profile=profile)
+            finally:
+                clip.close()
+        list_file.write(concat_list_entry(segment_path))
+    
+    try:
+        with open(list_path, "w") as list_file, SpeechPipeline(tts_cache, max_in_flight=max_tts_in_flight) as speech:
+            for i, (text_chunk, duration) in enumerate(iter_script(script)):
+                pending.append((i, text_chunk, duration, speech.submit(text_chunk)))
+                count += 1
+                if len(pending) > max_tts_in_flight:
+                    flush_oldest()
+            while pending:
+                flush_oldest()
+        if not count:
+            raise ValueError("The script has no segments")
+        concatenate_list_file(list_path, output_path)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+def create_text_to_video(script_data, bg_image_path="bg_generic.jpg", output_path="tutorial.mp4", render_mode="compose",
+                         workers=None, tts_cache=None, max_tts_in_flight=8, incremental=False, assets=None,
+                         profile=None, tracer=None):
     """
     Create a complete text-to-video from script data
     
     Args:
-        script_data: List of tuples (text, duration) or list of strings
+        script_data: Iterable of script items: (text, duration) pairs,
+            texts (durations are estimated) or {"text", "duration"} dicts,
+            see normalize_segment. May be a generator, e.g. iter_script_jsonl
         bg_image_path: Path to background image
         output_path: Output video file path
+        render_mode: "compose" renders the whole timeline frame by frame,
+            "static" encodes every unchanging segment from a single frame and
+            joins the segments without re-encoding, "parallel" does the same
+            with each segment built and encoded in its own worker process,
+            "stream" is like "static" but reads the script lazily and renders
+            each segment as it arrives, with constant memory use
+        workers: Number of worker processes for the "parallel" mode,
+            defaults to the number of CPUs
+        tts_cache: AudioCache used for speech, defaults to a gTTS cache in
+            the user cache directory
+        max_tts_in_flight: Number of TTS requests run concurrently while the
+            overlays are being rendered
+        incremental: Keep encoded segments next to output_path and only
+            rebuild the ones whose text, duration, assets or TTS settings
+            changed since the last run ("static" and "parallel" modes)
+        assets: AssetCache for backgrounds and fonts, pass one to share it
+            between jobs, defaults to a cache for this job only
+        profile: Render profile name or RenderProfile setting resolution,
+            fps and encoder speed, e.g. "draft-480p" for quick reviews
+            (default "1080p")
+        tracer: tracing.Tracer receiving the spans (TTS, overlays, clips,
+            encoders, composite frames) and cache/memory metrics of this
+            render; in "parallel" mode the workers' own work isn't traced
     """
+    if render_mode not in ("compose", "static", "parallel", "stream"):
+        raise ValueError(f"Unknown render mode: {render_mode}")
+    if incremental and render_mode in ("compose", "stream"):
+        raise ValueError("Incremental rendering needs the 'static' or 'parallel' render mode")
     
     # Ensure output directory exists
     output_dir = os.path.dirname(os.path.abspath(output_path))
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
     
-    # Process script data
-    if isinstance(script_data[0], str):
-        # If just text strings, estimate durations
-        processed_script = [(text, estimate_speech_duration(text)) for text in script_data]
-    else:
-        # Already has durations
-        processed_script = script_data
+    if tts_cache is None:
+        tts_cache = AudioCache()
+    if assets is None:
+        assets = AssetCache()
+    profile = get_profile(profile)
     
     clips = []
-    temp_files = []
-    
-    try:
-        for i, (text_chunk, duration) in enumerate(processed_script):
-            print(f"Processing segment {i+1}/{len(processed_script)}: {text_chunk[:50]}...")
+    with use_tracer(tracer):
+        try:
+            if render_mode == "stream":
+                print(f"Streaming segments to {output_path}...")
+                write_streamed_video(script_data, bg_image_path, output_path, tts_cache, assets, profile=profile,
+                                     max_tts_in_flight=max_tts_in_flight)
+                print(f"Video successfully created: {output_path}")
+                return
             
-            # Generate TTS audio
-            audio_path = f"temp_audio_{i}.mp3"
-            temp_files.append(audio_path)
+            # Process script data, the other modes need the whole script
+            processed_script = list(iter_script(script_data))
             
-            if generate_audio_for_text(text_chunk, audio_path):
-                # Load audio and adjust duration if needed
-                audio_clip = AudioFileClip(audio_path)
-                actual_duration = audio_clip.duration
-                
-                # Use actual audio duration if it's longer than estimated
-                final_duration = max(duration, actual_duration)
-                
-                # Create video clip
-                video_clip = make_clip(
-                    text_chunk, 
-                    final_duration, 
+            if render_mode != "compose":
+                # Each segment is encoded on its own and the files are joined
+                print(f"Rendering {len(processed_script)} segments to {output_path}...")
+                write_segmented_video(
+                    processed_script,
                     bg_image_path,
-                    font_size=60  # Larger font for better readability
+                    output_path,
+                    tts_cache,
+                    assets,
+                    profile=profile,
+                    parallel=render_mode == "parallel",
+                    workers=workers,
+                    incremental=incremental,
+                    max_tts_in_flight=max_tts_in_flight
                 )
-                
-                # Set audio
-                final_clip = video_clip.with_audio(audio_clip)
-                clips.append(final_clip)
-                
-            else:
-                # If TTS fails, create video-only clip
-                print(f"TTS failed for segment {i+1}, creating video-only clip")
-                video_clip = make_clip(text_chunk, duration, bg_image_path)
-                clips.append(video_clip)
-        
-        if not clips:
-            raise ValueError("No clips were successfully created")
-        
-        # Concatenate all clips
-        print("Combining all segments...")
-        final_video = concatenate_videoclips(clips, method="compose")
-        
-        # Write final video - FIXED: removed verbose parameter
-        print(f"Rendering final video to {output_path}...")
-        final_video.write_videofile(
-            output_path, 
-            fps=24,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True
-        )
-        
-        print(f"Video successfully created: {output_path}")
-        
-    except Exception as e:
-        print(f"Error creating video: {e}")
-        raise
-        
-    finally:
-        # Clean up temporary files
-        for temp_file in temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-            except:
-                pass
-        
-        # Close clips to free memory
-        for clip in clips:
-            try:
-                clip.close()
-            except:
-                pass
+                print(f"Video successfully created: {output_path}")
+                return
+            
+            segments = [(i, text_chunk, duration) for i, (text_chunk, duration) in enumerate(processed_script)]
+            clips, _ = build_clips(segments, len(segments), bg_image_path, tts_cache, assets, max_tts_in_flight, profile=profile)
+            
+            if not clips:
+                raise ValueError("No clips were successfully created")
+            
+            # Concatenate all clips
+            print("Combining all segments...")
+            final_video = concatenate_videoclips(clips, method="compose")
+            if tracer is not None:
+                final_video = timed_frames(final_video, "composite.frame")
+            
+            # Write final video - FIXED: removed verbose parameter
+            print(f"Rendering final video to {output_path}...")
+            with encoder_slot(), span("compose.write", frames=int(final_video.duration * profile.fps)):
+                # The audio is piped to ffmpeg from memory, there's no temporary audio file
+                write_clip(final_video, output_path, encoder_settings(profile, "slides"), fps=profile.fps)
+            
+            print(f"Video successfully created: {output_path}")
+            
+        except Exception as e:
+            print(f"Error creating video: {e}")
+            raise
+            
+        finally:
+            close_clips(clips)
+            if tracer is not None:
+                tracer.metric("assets", assets.stats())
+                tracer.metric("tts_cache", tts_cache.stats())
 
 # Example usage
 if __name__ == "__main__":
+    import argparse
+    from profiles import PROFILES
+    
+    parser = argparse.ArgumentParser(description="Render the example tutorial")
+    parser.add_argument("--profile", choices=list(PROFILES), default="1080p",
+                        help="render profile, e.g. draft-480p for a quick review")
+    parser.add_argument("--render-mode", choices=["compose", "static", "parallel", "stream"], default="compose")
+    parser.add_argument("--trace", default=None, help="write a Chrome trace (chrome://tracing, ui.perfetto.dev) here")
+    parser.add_argument("--profile-segment", type=int, default=None,
+                        help="sample the building and encoding of this segment, written next to the trace")
+    args = parser.parse_args()
+    tracer = None
+    if args.trace or args.profile_segment is not None:
+        tracer = tracing.Tracer(profile_segment=args.profile_segment)
+    
     # Script with estimated durations
     script = [
         ("Welcome to this tutorial on how to animate your images.", 4),
@@ -240,8 +763,19 @@ if __name__ == "__main__":
     
     # Create the video
     try:
-        create_text_to_video(script, bg_path, "tutorial.mp4")
+        create_text_to_video(script, bg_path, "tutorial.mp4", render_mode=args.render_mode, profile=args.profile,
+                             tracer=tracer)
     except Exception as e:
         print(f"Failed to create video: {e}")
         print("Trying with simple script ...")
-        create_text_to_video(simple_script, bg_path, "tutorial_simple.mp4")
\ No newline at end of file
+        create_text_to_video(simple_script, bg_path, "tutorial_simple.mp4", render_mode=args.render_mode, profile=args.profile,
+                             tracer=tracer)
+    
+    if tracer is not None:
+        trace_path = args.trace or "tutorial.trace.json"
+        tracer.export_chrome_trace(trace_path)
+        print(f"Trace written to {trace_path}")
+        if tracer.profiles:
+            profile_path = os.path.splitext(trace_path)[0] + ".folded"
+            tracer.write_profile(profile_path)
+            print(f"Profile of segment {args.profile_segment} written to {profile_path}")
\ No newline at end of file
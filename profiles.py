@@ -0,0 +1,36 @@
+"""Named output profiles: resolution, frame rate and encoder speed/quality"""
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Output settings passed through the whole render pipeline"""
+    name: str
+    size: tuple
+    fps: int
+    preset: str = "medium"
+    crf: int = 23
+    threads: int = None  # encoder threads per ffmpeg process, None lets x264 choose
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        # Fast previews for reviewers
+        RenderProfile("draft-480p", (854, 480), 10, preset="ultrafast", crf=30),
+        RenderProfile("720p", (1280, 720), 24, preset="veryfast", crf=23),
+        RenderProfile("1080p", (1920, 1080), 24, preset="medium", crf=23),
+        RenderProfile("4k", (3840, 2160), 24, preset="medium", crf=22),
+    )
+}
+
+DEFAULT_PROFILE = "1080p"
+
+def get_profile(profile=None):
+    """Return a RenderProfile from a profile name, a RenderProfile or None (default profile)"""
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if isinstance(profile, RenderProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown render profile {profile!r}, choose from {', '.join(PROFILES)}") from None
@@ -0,0 +1,112 @@
+"""
+Low resolution, all-intra proxy copies of source videos for fast previews
+
+Proxy frames are smaller than the clips they stand for, so a clip reading
+proxies is previewed through ``scale_clip``, which rebuilds it at the proxy
+scale: layers are resized, and their positions computed at full resolution
+then scaled, so ("center", top), pixel positions and resized layers land
+where they will in the final render.
+"""
+import os
+import subprocess as sp
+
+import numpy as np
+from moviepy import CompositeVideoClip, ImageClip
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import compute_position, cross_platform_popen_params
+from PIL import Image
+
+from timeline import OpacityMask, TimelineCompositeVideoClip, _still_coverage
+
+DEFAULT_PROXY_HEIGHT = 360
+
+def proxy_path(source_path, height=DEFAULT_PROXY_HEIGHT):
+    """Path of the proxy of a source video, stored next to it: clip.mp4 -> clip.proxy360.mp4"""
+    root, _ = os.path.splitext(source_path)
+    return f"{root}.proxy{height}.mp4"
+
+def make_proxy(source_path, height=DEFAULT_PROXY_HEIGHT, force=False):
+    """
+    Build the proxy of a source video if it is missing or older than the source, returns its path
+
+    The proxy has the source's frame rate and duration, no audio, and only
+    keyframes, so a reader can start at any time without decoding from a
+    previous keyframe. It is never taller than the source: a source at most
+    height pixels tall keeps its size.
+    """
+    output_path = proxy_path(source_path, height)
+    if (not force and os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(source_path)):
+        return output_path
+
+    print(f"Building proxy {output_path}...")
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.tmp{ext}"
+    cmd = [
+        FFMPEG_BINARY, "-y", "-loglevel", "error",
+        "-i", source_path,
+        "-an", "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+        "-g", "1", "-pix_fmt", "yuv420p",
+        tmp_path,
+    ]
+    proc = sp.run(cmd, **cross_platform_popen_params(
+        {"stdin": sp.DEVNULL, "stdout": sp.DEVNULL, "stderr": sp.PIPE}
+    ))
+    if proc.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise IOError(f"Could not build proxy {output_path}: {proc.stderr.decode(errors='replace')}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def scale_clip(clip, scale):
+    """Return a copy of a clip (or a composition, recursively) rendered at scale times its size"""
+    if isinstance(clip, CompositeVideoClip):
+        size = _scaled_size(clip.size, scale)
+        layers = [_scale_layer(layer, scale, clip.size) for layer in clip.clips]
+        if not clip.created_bg:
+            layers = [scale_clip(clip.bg, scale)] + layers
+        new_clip = TimelineCompositeVideoClip(
+            layers, size=size, bg_color=clip.bg_color, use_bgclip=not clip.created_bg, is_mask=clip.is_mask
+        )
+        new_clip = new_clip.with_start(clip.start).with_duration(clip.duration)
+        if clip.audio is not None:
+            new_clip = new_clip.with_audio(clip.audio)
+        return new_clip
+
+    size = _scaled_size(clip.size, scale)
+    if isinstance(clip, OpacityMask) and _still_coverage(clip) is not None:
+        # Faded still mask, kept recognizable by the compositor
+        new_clip = OpacityMask(_fit(clip.coverage, size), clip.opacity, duration=clip.duration)
+        return new_clip.with_start(clip.start).with_position(clip.pos, relative=clip.relative_pos)
+    if isinstance(clip, ImageClip) and clip.get_frame(0) is clip.img:
+        # Still picture, resized once instead of on every frame
+        new_clip = clip.image_transform(lambda frame: _fit(frame, size))
+    else:
+        new_clip = clip.with_updated_frame_function(lambda t: _fit(clip.get_frame(t), size))
+    if clip.mask is not None:
+        new_clip.mask = scale_clip(clip.mask, scale)
+    return new_clip
+
+def _scale_layer(layer, scale, canvas_size):
+    """Scale a layer of a composition, and its position on the canvas"""
+    def scaled_position(t):
+        x, y = compute_position(layer.size, canvas_size, layer.pos(t), layer.relative_pos)
+        return (int(round(x * scale)), int(round(y * scale)))
+
+    return scale_clip(layer, scale).with_position(scaled_position)
+
+def _scaled_size(size, scale):
+    return (max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale))))
+
+def _fit(frame, size):
+    """Resize a frame (or mask) to size, unless it already has it (e.g. read from a proxy)"""
+    if frame.shape[1] == size[0] and frame.shape[0] == size[1]:
+        return frame
+    if frame.ndim == 3 and frame.dtype != np.uint8:
+        # e.g. faded frames, the compositor converts them to uint8 anyway
+        frame = frame.astype(np.uint8)
+    if frame.dtype == np.uint8:
+        return np.asarray(Image.fromarray(frame).resize(size, Image.BILINEAR))
+    return np.asarray(Image.fromarray(frame.astype(np.float32)).resize(size, Image.BILINEAR))
@@ -0,0 +1,11 @@
+import os
+
+from assets import font_file
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "font", "font.ttf")
+
+def test_font_file_of_a_path():
+    assert font_file(FONT_PATH) == FONT_PATH
+
+def test_font_file_of_a_missing_font():
+    assert font_file("no-such-font-anywhere.ttf") is None
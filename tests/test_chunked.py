@@ -0,0 +1,34 @@
+import pytest
+from moviepy import ColorClip
+
+from chunked import chunk_ranges, write_videofile_chunked
+
+@pytest.mark.parametrize("n_frames, gop, chunks", [
+    (1, 48, 4),
+    (47, 48, 4),
+    (48, 48, 4),
+    (49, 48, 4),
+    (1000, 48, 8),
+    (1000, 48, 64),
+    (1000, 1, 3),
+])
+def test_chunk_ranges_cover_every_frame_once(n_frames, gop, chunks):
+    ranges = chunk_ranges(n_frames, gop, chunks)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == n_frames
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(start < end for start, end in ranges)
+    assert all(start % gop == 0 for start, _ in ranges)
+    assert len(ranges) <= chunks
+
+def test_chunk_ranges_balance_whole_gops():
+    assert chunk_ranges(10 * 24, 24, 5) == [(0, 48), (48, 96), (96, 144), (144, 192), (192, 240)]
+    assert chunk_ranges(100, 24, 2) == [(0, 72), (72, 100)]
+
+def test_chunk_ranges_of_no_frames():
+    assert chunk_ranges(0, 24, 4) == []
+
+def test_clip_shorter_than_a_frame(tmp_path):
+    clip = ColorClip((16, 16), color=(0, 0, 0), duration=0.01)
+    with pytest.raises(ValueError, match="less than one frame"):
+        write_videofile_chunked(clip, str(tmp_path / "out.mp4"), fps=24)
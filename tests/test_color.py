@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from color import Mix, channel_mixer, compile_color, gamma, grayscale, invert, levels, sepia, tint
+
+def sepia_filter(frame):
+    # The float version of trailer.py
+    sepia_matrix = np.array([[0.393, 0.769, 0.189], [0.349, 0.686, 0.168], [0.272, 0.534, 0.131]])
+    return np.clip(np.dot(frame.astype(np.float32), sepia_matrix.T), 0, 255).astype(np.uint8)
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)
+    frame[0, :4] = [[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 128, 255]]
+    return frame
+
+def test_sepia_matches_float_filter(frame):
+    expected = sepia_filter(frame).astype(int)
+    result = compile_color(sepia())(frame).astype(int)
+    assert np.abs(result - expected).max() <= 1
+    assert np.mean(result != expected) < 0.001
+
+@pytest.mark.parametrize("first, second", [
+    (sepia(), tint(0.5, 0.5, 0.5)),
+    (sepia(), grayscale()),
+    (channel_mixer(np.eye(3), (-40, 0, 40)), tint(0.8, 1, 1.2)),
+    (tint(1.5, 1, 1), sepia()),
+    (grayscale(), sepia()),
+    (tint(0.5, 0.7, 0.9), channel_mixer(np.eye(3) * 2)),
+    (gamma(1.5), levels(20, 230)),
+    (invert(), gamma(0.7)),
+    (levels(10, 240), sepia()),
+])
+def test_fused_chain_matches_separate_passes(frame, first, second):
+    fused = compile_color(first, second)(frame).astype(int)
+    separate = compile_color(second)(compile_color(first)(frame)).astype(int)
+    assert np.abs(fused - separate).max() <= 1
+
+def test_clipping_mix_is_not_fused():
+    white = np.full((1, 1, 3), 255, dtype=np.uint8)
+    assert compile_color(sepia(), tint(0.5, 0.5, 0.5))(white).tolist() == [[[127, 127, 119]]]
+    assert len(compile_color(sepia(), tint(0.5, 0.5, 0.5)).passes) == 2
+    assert len(compile_color(grayscale(), sepia()).passes) == 1
+    assert len(compile_color(grayscale(), grayscale(), sepia()).passes) == 1
+
+def test_curves_fuse_exactly(frame):
+    pipeline = compile_color(gamma(1.5), levels(20, 230), invert())
+    assert len(pipeline.passes) == 1
+    separate = compile_color(invert())(compile_color(levels(20, 230))(compile_color(gamma(1.5))(frame)))
+    assert np.array_equal(pipeline(frame), separate)
+
+def test_alpha_is_kept(frame):
+    rgba = np.dstack([frame, np.full(frame.shape[:2], 7, dtype=np.uint8)])
+    result = compile_color(sepia())(rgba)
+    assert result.shape == rgba.shape
+    assert np.all(result[..., 3] == 7)
+    assert np.array_equal(result[..., :3], compile_color(sepia())(frame))
+
+def test_rejects_unknown_operations():
+    with pytest.raises(TypeError):
+        compile_color(sepia(), "tint")
+
+def test_stays_in_range():
+    assert grayscale().stays_in_range()
+    assert tint(0.5, 1, 0.2).stays_in_range()
+    assert not sepia().stays_in_range()
+    assert not Mix(np.eye(3), (1, 0, 0)).stays_in_range()
+    assert not Mix(-np.eye(3)).stays_in_range()
@@ -0,0 +1,109 @@
+import pytest
+
+from benchmark import synthetic_video
+from edit import Layer, _effects, _plan_reads, _resolve_timings, compile_edit
+
+def make_layers(*specs):
+    return [Layer(spec, index) for index, spec in enumerate(specs)]
+
+def video_layer(layer_id, source_start, source_end, start, source="a.mp4"):
+    layer = Layer({"id": layer_id, "video": source}, 0)
+    layer.source, layer.source_start, layer.source_end = source, source_start, source_end
+    layer.start, layer.end = start, start + source_end - source_start
+    return layer
+
+def test_relative_timings():
+    layers = make_layers(
+        {"id": "logo", "image": "logo.png", "start": "title.start + 2", "end": "title.end"},
+        {"id": "title", "text": "Hi", "start": 3, "duration": 6},
+        {"id": "outro", "text": "Bye", "start": "logo.end - 1.5", "duration": 2},
+        {"text": "Default start", "end": ".5"},
+    )
+    _resolve_timings(layers)
+    assert [(layer.start, layer.end) for layer in layers] == [(5, 9), (3, 9), (7.5, 9.5), (0, 0.5)]
+    assert layers[3].id == "layer3"
+
+def test_video_layers_last_their_natural_duration():
+    layers = make_layers(
+        {"id": "slowmo", "video": "a", "start": 2},
+        {"id": "text", "text": "Hi", "start": "slowmo.end"},
+    )
+    layers[0].natural_duration = 6.4
+    layers[1].spec["duration"] = 1
+    _resolve_timings(layers)
+    assert (layers[0].start, layers[0].end) == (2, 8.4)
+    assert layers[1].start == 8.4
+
+def test_timing_cycle():
+    layers = make_layers(
+        {"id": "a", "text": "a", "start": "c.end", "duration": 1},
+        {"id": "b", "text": "b", "start": "a.end", "duration": 1},
+        {"id": "c", "text": "c", "start": "b.end", "duration": 1},
+    )
+    with pytest.raises(ValueError, match="Timing cycle: a -> c -> b -> a"):
+        _resolve_timings(layers)
+
+@pytest.mark.parametrize("spec, message", [
+    ({"id": "a", "text": "a", "start": "nope.end", "duration": 1}, "unknown layer 'nope'"),
+    ({"id": "a", "text": "a", "start": "a.end +", "duration": 1}, "can't read start"),
+    ({"id": "a", "text": "a", "start": 1}, "needs an end or a duration"),
+])
+def test_timing_errors(spec, message):
+    with pytest.raises(ValueError, match=message):
+        _resolve_timings(make_layers(spec))
+
+def test_reads_merge_layers_in_source_and_timeline_order():
+    layers = [video_layer("intro", 1, 5, 0), video_layer("bird", 5.5, 8, 4), video_layer("far", 30, 32, 7)]
+    reads = _plan_reads(layers, merge_gap=1.0)
+    assert [(read.start, read.end, [layer.id for layer in read.layers]) for read in reads] == [
+        (1, 8, ["intro", "bird"]),
+        (30, 32, ["far"]),
+    ]
+
+def test_reads_never_seek_back():
+    # "later" comes later in the source but plays first
+    layers = [video_layer("first", 1, 5, 3), video_layer("later", 5, 7, 0)]
+    assert [[layer.id for layer in read.layers] for read in _plan_reads(layers, merge_gap=1.0)] == [
+        ["first"], ["later"],
+    ]
+
+def test_reads_never_overlap_on_the_timeline():
+    layers = [video_layer("a", 1, 5, 0), video_layer("b", 4, 6, 2)]
+    assert len(_plan_reads(layers, merge_gap=1.0)) == 2
+
+def test_reads_are_per_source():
+    layers = [video_layer("a", 1, 5, 0, "a.mp4"), video_layer("b", 5, 7, 4, "b.mp4")]
+    assert sorted(read.source for read in _plan_reads(layers, merge_gap=1.0)) == ["a.mp4", "b.mp4"]
+
+def test_speed_changes_are_fused():
+    effects = _effects([["FadeIn", 1], ["MultiplySpeed", 0.5], ["MultiplySpeed", 0.5], ["CrossFadeIn", 1]])
+    assert [type(effect).__name__ for effect in effects] == ["FadeIn", "MultiplySpeed", "CrossFadeIn"]
+    assert effects[1].factor == 0.25
+    with pytest.raises(ValueError, match="Unknown effect"):
+        _effects([["Sparkles"]])
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    return synthetic_video(str(tmp_path_factory.mktemp("edit") / "source.mp4"), duration=10, size=(64, 36))
+
+def test_compile_edit(source):
+    plan = compile_edit({
+        "fps": 24,
+        "sources": {"src": source},
+        "layers": [
+            {"id": "intro", "video": "src", "from": 1, "to": 5, "cut": [[1, 2]]},
+            {"id": "slowmo", "video": "src", "from": 5.5, "to": 7, "start": "intro.end",
+             "filters": [["sepia"]], "effects": [["MultiplySpeed", 0.5], ["CrossFadeIn", 0.5]]},
+            {"id": "flash", "video": "src", "from": 8, "to": 9, "start": 0},
+        ],
+    })
+    timings = {layer.id: (layer.start, layer.end) for layer in plan.layers}
+    assert timings == {"intro": (0, 3), "slowmo": (3, 6), "flash": (0, 1)}
+    assert [(read.start, read.end, read.layers) for read in plan.reads] == [
+        (1, 7, ["intro", "slowmo"]),
+        (8, 9, ["flash"]),
+    ]
+    assert plan.clip.duration == 6
+    assert plan.clip.mask is None
+    assert plan.clip.get_frame(4).shape == (36, 64, 3)
+    assert plan.cost()["decoded_frames"] == (6 + 1) * 24
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from encoding import encode_video
+
+def test_failed_frames_leave_no_file(tmp_path):
+    def frames():
+        for _ in range(12):
+            yield np.zeros((16, 16, 3), dtype=np.uint8)
+        raise RuntimeError("clip error")
+
+    with pytest.raises(RuntimeError, match="clip error"):
+        encode_video(str(tmp_path / "out.mp4"), frames(), (16, 16), 24, audio="silence")
+    assert list(tmp_path.iterdir()) == []
+
+def test_encodes_frames(tmp_path):
+    frames = (np.full((16, 16, 3), n, dtype=np.uint8) for n in range(24))
+    encode_video(str(tmp_path / "out.mp4"), frames, (16, 16), 24)
+    assert [path.name for path in tmp_path.iterdir()] == ["out.mp4"]
@@ -0,0 +1,30 @@
+import os
+
+from moviepy import VideoFileClip
+
+from benchmark import synthetic_video
+from decoders import DecoderPool
+from proxies import make_proxy
+
+def test_proxy_never_upscales(tmp_path):
+    small = synthetic_video(str(tmp_path / "small.mp4"), duration=1, size=(128, 72))
+    large = synthetic_video(str(tmp_path / "large.mp4"), duration=1, size=(256, 144))
+    for source, expected in ((small, [128, 72]), (large, [192, 108])):
+        proxy = VideoFileClip(make_proxy(source, height=108))
+        assert proxy.size == expected
+        proxy.close()
+
+def test_small_sources_are_their_own_proxy(tmp_path):
+    small = synthetic_video(str(tmp_path / "small.mp4"), duration=1, size=(128, 72))
+    decoders = DecoderPool(proxy_height=108)
+    try:
+        clip = decoders.subclip(small, 0, 0.5)
+        assert clip.get_frame(0.25).shape == (72, 128, 3)
+        assert decoders.preview_scale() == 1
+        assert not os.path.exists(os.path.join(tmp_path, "small.proxy108.mp4"))
+
+        large = synthetic_video(str(tmp_path / "large.mp4"), duration=1, size=(256, 144))
+        decoders.subclip(large, 0, 0.5)
+        assert decoders.preview_scale() == 0.75
+    finally:
+        decoders.close()
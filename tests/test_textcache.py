@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+from moviepy import TextClip
+from PIL import Image, ImageDraw, ImageFont
+
+from textcache import TextRasterCache, rasterize_text
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "font", "font.ttf")
+
+def draw_directly(text, font, align, size=(900, 300), origin=(100, 80)):
+    coverage = Image.new("L", size, 0)
+    ImageDraw.Draw(coverage).multiline_text(origin, text, font=font, fill=255, align=align)
+    return np.asarray(coverage)
+
+def paste_raster(raster, size=(900, 300), origin=(100, 80)):
+    coverage = np.zeros((size[1], size[0]), dtype=np.uint8)
+    x, y = origin[0] + raster.offset[0], origin[1] + raster.offset[1]
+    h, w = raster.alpha.shape
+    coverage[y:y + h, x:x + w] = raster.alpha
+    return coverage
+
+def test_render_matches_multiline_text():
+    font = ImageFont.truetype(FONT_PATH, 40)
+    cache = TextRasterCache()
+    for align in ("left", "center", "right"):
+        text = "A short line\nand a much longer second line"
+        raster = cache.render(text, FONT_PATH, 40, color=(255, 255, 255), align=align)
+        assert np.array_equal(paste_raster(raster), draw_directly(text, font, align))
+        measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+        assert raster.bbox == measure.multiline_textbbox((0, 0), text, font=font)
+
+def test_render_wraps_and_premultiplies():
+    font = ImageFont.truetype(FONT_PATH, 30)
+    raster = rasterize_text("one two three four five", font, color=(200, 100, 0), wrap_width=9)
+    assert raster.text == "one two\nthree\nfour five"
+    alpha = raster.alpha.astype(np.uint16)
+    expected = (alpha[:, :, None] * np.array([200, 100, 0], dtype=np.uint16) + 127) // 255
+    assert np.array_equal(raster.rgba[:, :, :3], expected)
+
+def test_repeated_text_is_a_hit():
+    cache = TextRasterCache()
+    first = cache.render("Title", FONT_PATH, 50)
+    assert cache.render("Title", FONT_PATH, 50) is first
+    cache.render("Title", FONT_PATH, 51)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_text_clip_matches_textclip():
+    cache = TextRasterCache()
+    for _ in range(2):
+        clip = cache.text_clip(font=FONT_PATH, text="Revenge is coming...", font_size=50, color="#fff")
+        expected = TextClip(font=FONT_PATH, text="Revenge is coming...", font_size=50, color="#fff")
+        assert clip.size == expected.size
+        assert np.abs(clip.mask.get_frame(0) - expected.mask.get_frame(0)).max() <= 1 / 255
+        visible = expected.mask.get_frame(0) > 0
+        assert np.array_equal(clip.get_frame(0)[visible], expected.get_frame(0)[visible])
+    assert cache.hits == 1
+
+def test_least_recently_used_texts_are_evicted():
+    cache = TextRasterCache()
+    sizes = [cache.render(text, FONT_PATH, 40).rgba.nbytes for text in ("a", "b", "c")]
+    cache = TextRasterCache(max_bytes=sizes[0] + sizes[1])
+    cache.render("a", FONT_PATH, 40)
+    cache.render("b", FONT_PATH, 40)
+    cache.render("a", FONT_PATH, 40)
+    cache.render("c", FONT_PATH, 40)
+    assert cache.stats()["entries"] < 3
+    assert cache.bytes <= cache.max_bytes
+    misses = cache.misses
+    cache.render("c", FONT_PATH, 40)
+    assert cache.misses == misses
+    cache.render("b", FONT_PATH, 40)
+    assert cache.misses == misses + 1
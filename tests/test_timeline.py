@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from moviepy import ColorClip, CompositeVideoClip, ImageClip, vfx
+
+from timeline import CrossFadeIn, CrossFadeOut, IntervalIndex, TimelineCompositeVideoClip
+
+def test_interval_index_is_half_open():
+    index = IntervalIndex(["a", "b"], [(0, 2), (2, 5)])
+    assert index.at(-0.1) == []
+    assert index.at(0) == ["a"]
+    assert index.at(1.999) == ["a"]
+    assert index.at(2) == ["b"]
+    assert index.at(4.999) == ["b"]
+    assert index.at(5) == []
+
+def test_interval_index_keeps_item_order():
+    index = IntervalIndex(["bottom", "middle", "top"], [(1, 4), (0, 10), (3, 5)])
+    assert index.at(0.5) == ["middle"]
+    assert index.at(3.5) == ["bottom", "middle", "top"]
+    assert index.at(4) == ["middle", "top"]
+    assert index.at(10) == []
+
+def test_interval_index_open_ended_and_empty_intervals():
+    index = IntervalIndex(["forever", "empty"], [(1, None), (2, 2)])
+    assert index.at(0) == []
+    assert index.at(1) == ["forever"]
+    assert index.at(2) == ["forever"]
+    assert index.at(1e9) == ["forever"]
+
+def test_interval_index_without_items():
+    assert IntervalIndex([], []).at(0) == []
+
+def layers(cross_fade_in, cross_fade_out):
+    background = ColorClip((64, 48), color=(10, 120, 200), duration=4)
+    coverage = np.zeros((20, 30))
+    coverage[4:16, 5:25] = 1
+    coverage[8:12, 10:20] = 0.5
+    logo = ImageClip(np.full((20, 30, 3), (250, 200, 20), dtype=np.uint8))
+    logo = logo.with_mask(ImageClip(coverage, is_mask=True))
+    logo = logo.with_start(0.5).with_duration(3).with_position((20, 10))
+    logo = logo.with_effects([cross_fade_in(1), cross_fade_out(1)])
+    offscreen = ColorClip((10, 10), color=(255, 0, 0), duration=4).with_position((100, 100))
+    return [background, logo, offscreen]
+
+@pytest.mark.parametrize("t", [0, 0.7, 1.2, 2, 3.1, 3.49, 3.9])
+def test_composite_matches_moviepy(t):
+    expected = CompositeVideoClip(layers(vfx.CrossFadeIn, vfx.CrossFadeOut), bg_color=(0, 0, 0))
+    composite = TimelineCompositeVideoClip(layers(CrossFadeIn, CrossFadeOut), bg_color=(0, 0, 0))
+    assert composite.mask is None
+    assert np.abs(composite.get_frame(t).astype(int) - expected.get_frame(t)).max() <= 1
+
+def test_playing_clips_skip_inactive_and_offscreen_layers():
+    background, logo, offscreen = layers(CrossFadeIn, CrossFadeOut)
+    composite = TimelineCompositeVideoClip([background, logo, offscreen])
+    assert composite.playing_clips(0.2) == [background]
+    assert composite.playing_clips(1) == [background, logo]
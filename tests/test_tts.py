@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+
+from tts import AudioCache, StubSynthesizer
+
+@pytest.fixture
+def cache(tmp_path):
+    return AudioCache(StubSynthesizer(), cache_dir=str(tmp_path), max_bytes=10 ** 9, min_age=0)
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+def test_audio_is_synthesized_once(cache):
+    path = cache.get("Hello world")
+    assert os.path.exists(path)
+    assert cache.get("Hello world") == path
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get("Hello world", slow=True) != path
+    assert [name for name in os.listdir(cache.cache_dir) if name.startswith(".tmp_")] == []
+
+def test_key_depends_on_backend_settings(tmp_path):
+    fast = AudioCache(StubSynthesizer(words_per_minute=150), cache_dir=str(tmp_path))
+    slow = AudioCache(StubSynthesizer(words_per_minute=100), cache_dir=str(tmp_path))
+    assert fast.key("Hello") != slow.key("Hello")
+    assert fast.key("Hello") == fast.key("Hello")
+
+def test_least_recently_used_files_are_evicted(cache):
+    paths = [cache.get(text) for text in ("one", "two", "three")]
+    for seconds, path in zip((300, 100, 200), paths):
+        age(path, seconds)
+    size = os.path.getsize(paths[0])
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+    cache.max_bytes = size
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [False, True, False]
+
+def test_recently_used_files_are_kept(cache):
+    paths = [cache.get(text) for text in ("one", "two")]
+    age(paths[0], 300)
+    cache.min_age = 60
+    cache.max_bytes = 0
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [False, True]
+
+def test_hit_refreshes_the_access_time(cache):
+    paths = [cache.get(text) for text in ("one", "two")]
+    age(paths[0], 300)
+    age(paths[1], 200)
+    cache.get("one")
+    cache.max_bytes = os.path.getsize(paths[0])
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [True, False]
@@ -0,0 +1,147 @@
+"""Cache of rasterized text blocks, shared by TextClips and create_text_overlay"""
+import math
+import os
+import textwrap
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from moviepy import ImageClip, TextClip
+from PIL import Image, ImageColor, ImageDraw
+
+from assets import _mtime, load_font
+
+class TextRaster(namedtuple("TextRaster", "rgba offset bbox text color")):
+    """
+    A rasterized text block
+
+    rgba is premultiplied RGBA uint8 covering every inked pixel, offset the
+    position of its top-left pixel relative to the point the text is drawn
+    at, bbox the (left, top, right, bottom) layout box of the text relative
+    to that point, as multiline_textbbox measures it, text the text as laid
+    out (wrapped) and color its RGB ink color.
+    """
+    __slots__ = ()
+
+    @property
+    def alpha(self):
+        """Coverage of each pixel, 0 to 255"""
+        return self.rgba[:, :, 3]
+
+    @property
+    def size(self):
+        """Width and height of the layout box"""
+        left, top, right, bottom = self.bbox
+        return (right - left, bottom - top)
+
+    def straight_rgb(self):
+        """RGB without premultiplication: the ink color on inked pixels, black elsewhere"""
+        return np.where(self.alpha[:, :, None] > 0, np.array(self.color, dtype=np.uint8), np.uint8(0))
+
+def _premultiply(alpha, color):
+    """Premultiplied RGBA of a single color drawn with coverage alpha"""
+    alpha = alpha.astype(np.uint16)
+    rgb = (alpha[:, :, None] * np.array(color, dtype=np.uint16) + 127) // 255
+    rgba = np.dstack([rgb.astype(np.uint8), alpha.astype(np.uint8)])
+    rgba.flags.writeable = False
+    return rgba
+
+def rasterize_text(text, font, color=(255, 255, 255), align="center", wrap_width=None):
+    """Rasterize a (wrapped) multiline text block with a loaded font"""
+    if wrap_width:
+        text = textwrap.fill(text, width=wrap_width)
+    color = ImageColor.getrgb(color) if isinstance(color, str) else tuple(color[:3])
+    measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+    # Layout box as measured for left aligned text, lines are then aligned within it
+    bbox = measure.multiline_textbbox((0, 0), text, font=font)
+    aligned = measure.multiline_textbbox((0, 0), text, font=font, align=align)
+    left = min(bbox[0], math.floor(aligned[0]))
+    top = min(bbox[1], math.floor(aligned[1]))
+    right = max(bbox[2], math.ceil(aligned[2]))
+    bottom = max(bbox[3], math.ceil(aligned[3]))
+    coverage = Image.new("L", (max(right - left, 1), max(bottom - top, 1)), 0)
+    ImageDraw.Draw(coverage).multiline_text((-left, -top), text, font=font, fill=255, align=align)
+    return TextRaster(_premultiply(np.asarray(coverage), color), (left, top), bbox, text, color)
+
+class TextRasterCache:
+    """
+    Rasterized text blocks and glyph metrics, keyed by font file, size, color, alignment, wrap width and text
+
+    ``render`` lays out and rasterizes a text block with Pillow, as
+    create_text_overlay draws it; ``text_clip`` builds the same clip as
+    moviepy's TextClip. Either way a repeated text (titles, lower-thirds, the
+    unchanged lines of a re-rendered script) skips FreeType layout and
+    rasterization. Entries are kept up to ``max_bytes``, least recently used
+    first out; an edited font file invalidates its entries.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, font_loader=load_font):
+        self.max_bytes = max_bytes
+        self.font_loader = font_loader
+        self._rasters = OrderedDict()
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, load):
+        with self._lock:
+            raster = self._rasters.get(key)
+            if raster is not None:
+                self._rasters.move_to_end(key)
+                self.hits += 1
+                return raster
+            self.misses += 1
+        raster = load()
+        with self._lock:
+            if key not in self._rasters:
+                self._rasters[key] = raster
+                self.bytes += raster.rgba.nbytes
+                while self.bytes > self.max_bytes and len(self._rasters) > 1:
+                    _, old = self._rasters.popitem(last=False)
+                    self.bytes -= old.rgba.nbytes
+            return self._rasters[key]
+
+    def char_width(self, font_path, font_size, char="A"):
+        """Advance box width of a character, as font.getbbox(char)[2]"""
+        key = (font_path, _mtime(font_path), font_size, char)
+        with self._lock:
+            if key in self._metrics:
+                return self._metrics[key]
+        width = self.font_loader(font_path, font_size).getbbox(char)[2]
+        with self._lock:
+            return self._metrics.setdefault(key, width)
+
+    def render(self, text, font_path, font_size, color=(255, 255, 255), align="center", wrap_width=None):
+        """Return the TextRaster of a text block, wrapped at wrap_width characters if given"""
+        key = ("block", os.path.abspath(font_path), _mtime(font_path), font_size, str(color), align, wrap_width, text)
+        return self._get(key, lambda: rasterize_text(
+            text, self.font_loader(font_path, font_size), color, align, wrap_width
+        ))
+
+    def text_clip(self, font, text, font_size, color="black", text_align="left"):
+        """Same clip as TextClip(font=..., text=..., ...), rasterized once per distinct text"""
+        key = ("clip", os.path.abspath(font), _mtime(font), font_size, str(color), text_align, None, text)
+
+        def load():
+            clip = TextClip(font=font, text=text, font_size=font_size, color=color, text_align=text_align)
+            alpha = np.round(clip.mask.img * 255).astype(np.uint8)
+            ink = ImageColor.getrgb(color) if isinstance(color, str) else tuple(color[:3])
+            return TextRaster(_premultiply(alpha, ink), (0, 0), (0, 0) + tuple(clip.size), text, ink)
+
+        raster = self._get(key, load)
+        clip = ImageClip(raster.straight_rgb())
+        return clip.with_mask(ImageClip(raster.alpha / 255.0, is_mask=True))
+
+    def stats(self):
+        """Return hit/miss counters and memory usage"""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._rasters), "bytes": self.bytes}
+
+    def clear(self):
+        with self._lock:
+            self._rasters.clear()
+            self._metrics.clear()
+            self.bytes = 0
@@ -0,0 +1,304 @@
+"""Compositing helpers for long timelines made of many short layers"""
+from bisect import bisect_right
+from dataclasses import dataclass
+
+import numpy as np
+from moviepy import CompositeVideoClip, ImageClip, VideoClip, vfx
+from moviepy.Effect import Effect
+from moviepy.tools import compute_position
+from PIL import Image
+
+class IntervalIndex:
+    """
+    Index of items active over [start, end) intervals, answering "what is active at t"
+
+    The timeline is cut at every start and end; each elementary span stores
+    the items covering it, in their original order. A lookup is one bisect,
+    so its cost depends on the number of active items, not on the total.
+    """
+
+    def __init__(self, items, intervals):
+        bounds = sorted({b for start, end in intervals for b in (start, end) if b is not None})
+        self.bounds = bounds
+        # spans[k] covers [bounds[k-1], bounds[k]), spans[0] is before the first bound
+        self.spans = [[] for _ in range(len(bounds) + 1)]
+        for item, (start, end) in zip(items, intervals):
+            first = bisect_right(bounds, start)
+            last = len(bounds) if end is None else bisect_right(bounds, end) - 1
+            for k in range(first, last + 1):
+                self.spans[k].append(item)
+
+    def at(self, t):
+        """Return the items whose interval contains t"""
+        return self.spans[bisect_right(self.bounds, t)]
+
+class OpacityMask(VideoClip):
+    """
+    Mask made of a constant coverage times an opacity varying over time
+
+    Its frames are ``opacity(t) * coverage``, like the masks vfx.CrossFadeIn
+    and vfx.CrossFadeOut build, but TimelineCompositeVideoClip can read the
+    opacity and blend the layer with a single scalar per frame.
+    """
+
+    def __init__(self, coverage, opacity=None, duration=None):
+        self.coverage = coverage
+        self.opacity = opacity or _opaque
+        self._opacity_frame_function = lambda t: self.opacity(t) * self.coverage
+        super().__init__(frame_function=self._opacity_frame_function, is_mask=True, duration=duration)
+
+def _opaque(t):
+    return 1.0
+
+def _still_coverage(mask):
+    """(coverage, opacity) of a mask that is a constant picture times an opacity, or None"""
+    if isinstance(mask, OpacityMask) and mask.frame_function is mask._opacity_frame_function:
+        return mask.coverage, mask.opacity
+    if isinstance(mask, ImageClip) and mask.img is not None and mask.get_frame(0) is mask.img:
+        return mask.img, _opaque
+    return None
+
+@dataclass
+class CrossFadeIn(Effect):
+    """
+    Same as vfx.CrossFadeIn: the clip appears progressively over ``duration`` seconds
+
+    On clips whose mask is still (texts, logos) the fade is kept as an
+    opacity over the unchanged mask, which TimelineCompositeVideoClip blends
+    without recomputing the mask.
+    """
+
+    duration: float
+
+    def apply(self, clip):
+        if clip.duration is None:
+            raise ValueError("Attribute 'duration' not set")
+        still = _still_coverage(clip.mask) if clip.mask is not None else (np.ones((clip.h, clip.w)), _opaque)
+        if still is None:
+            return vfx.CrossFadeIn(self.duration).apply(clip)
+        coverage, opacity = still
+        fade = self.duration
+
+        def faded_opacity(t):
+            return opacity(t) * (1.0 if t >= fade else t / fade)
+
+        clip = clip.copy()
+        clip.mask = OpacityMask(coverage, faded_opacity, duration=clip.duration)
+        return clip
+
+@dataclass
+class CrossFadeOut(Effect):
+    """Same as vfx.CrossFadeOut: the clip disappears progressively over its last ``duration`` seconds, see CrossFadeIn"""
+
+    duration: float
+
+    def apply(self, clip):
+        if clip.duration is None:
+            raise ValueError("Attribute 'duration' not set")
+        still = _still_coverage(clip.mask) if clip.mask is not None else (np.ones((clip.h, clip.w)), _opaque)
+        if still is None:
+            return vfx.CrossFadeOut(self.duration).apply(clip)
+        coverage, opacity = still
+        fade, end = self.duration, clip.duration
+
+        def faded_opacity(t):
+            return opacity(t) * (1.0 if end - t >= fade else (end - t) / fade)
+
+        clip = clip.copy()
+        clip.mask = OpacityMask(coverage, faded_opacity, duration=clip.duration)
+        return clip
+
+class _FadedLayer:
+    """
+    A layer whose mask is a constant coverage times an opacity, blended over frames within its inked box
+
+    The pixels of still layers (images, texts) are converted once; other
+    layers (videos cross faded as a whole) are read every frame, and their
+    uniform coverage makes the blend a single scalar.
+    """
+
+    def __init__(self, clip, coverage, opacity, still):
+        ys, xs = np.nonzero(coverage)
+        self.visible = len(ys) > 0
+        if not self.visible:
+            return
+        top, bottom, left, right = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        self.box = (slice(top, bottom), slice(left, right))
+        self.offset = (int(left), int(top))
+        self.coverage = coverage[self.box][:, :, None].astype(np.float32)
+        self.uniform = bool(np.all(self.coverage == 1))
+        self.rgb = clip.img[self.box][:, :, :3].astype(np.float32) if still else None
+        self.opacity = opacity
+
+    def blend(self, frame, clip, t):
+        """Blend the layer over a (height, width, 3 or 4) uint8 frame, in place, like compose_on"""
+        ct = t - clip.start
+        opacity = self.opacity(ct)
+        if not self.visible or opacity <= 0:
+            return
+        canvas_h, canvas_w = frame.shape[:2]
+        x, y = compute_position(clip.size, (canvas_w, canvas_h), clip.pos(ct), clip.relative_pos)
+        x, y = x + self.offset[0], y + self.offset[1]
+        h, w = self.coverage.shape[:2]
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + w, canvas_w), min(y + h, canvas_h)
+        if left >= right or top >= bottom:
+            return
+        layer = (slice(top - y, bottom - y), slice(left - x, right - x))
+        rgb = self.rgb if self.rgb is not None else clip.get_frame(ct)[self.box][:, :, :3]
+        rgb = rgb[layer]
+        region = frame[top:bottom, left:right]
+        # 8-bit alpha, as compose_on quantizes the mask
+        if self.uniform:
+            alpha = np.float32(np.floor(opacity * 255) / 255)
+        else:
+            alpha = np.floor(self.coverage[layer] * np.float32(opacity * 255)) * np.float32(1 / 255)
+        if frame.shape[2] == 3:
+            region[...] = rgb * alpha + region * (1 - alpha) + 0.5
+            return
+        # Transparent background, as for a CompositeVideoClip without bg_color
+        below_alpha = region[:, :, 3:]
+        if not below_alpha.any():
+            region[:, :, :3] = np.where(alpha > 0, rgb, 0)
+            region[:, :, 3:] = alpha * 255 + 0.5
+        elif np.all(below_alpha == 255):
+            region[:, :, :3] = rgb * alpha + region[:, :, :3] * (1 - alpha) + 0.5
+        else:
+            below = below_alpha * np.float32(1 / 255) * (1 - alpha)
+            out_alpha = alpha + below
+            region[:, :, :3] = (rgb * alpha + region[:, :, :3] * below) / np.maximum(out_alpha, np.float32(1e-6)) + 0.5
+            region[:, :, 3:] = out_alpha * 255 + 0.5
+
+def _paste(frame, clip, t):
+    """Paste an opaque layer (no mask) over a uint8 frame, returns the frame, or None if the layer isn't RGB"""
+    ct = t - clip.start
+    picture = clip.get_frame(ct)
+    if picture.ndim != 3 or picture.shape[2] != 3:
+        return None
+    if picture.dtype != np.uint8:
+        picture = picture.astype("uint8")
+    canvas_h, canvas_w = frame.shape[:2]
+    h, w = picture.shape[:2]
+    x, y = compute_position((w, h), (canvas_w, canvas_h), clip.pos(ct), clip.relative_pos)
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + w, canvas_w), min(y + h, canvas_h)
+    if (left, top, right, bottom) == (0, 0, canvas_w, canvas_h):
+        # Covers the whole canvas, which becomes opaque
+        return np.array(picture[-y:canvas_h - y, -x:canvas_w - x])
+    if left < right and top < bottom:
+        frame[top:bottom, left:right, :3] = picture[top - y:bottom - y, left - x:right - x]
+        if frame.shape[2] == 4:
+            frame[top:bottom, left:right, 3] = 255
+    return frame
+
+class TimelineCompositeVideoClip(CompositeVideoClip):
+    """
+    CompositeVideoClip that only composites the layers visible at each frame
+
+    Drop-in replacement for CompositeVideoClip. Layers are indexed by their
+    [start, end) interval, so finding the layers playing at t doesn't scan the
+    whole layer list. Layers placed entirely off-screen at t, and layers whose
+    mask is a constant fully transparent image, are skipped.
+
+    Still layers (an ImageClip or text whose mask is constant, or faded with
+    this module's CrossFadeIn/CrossFadeOut) are converted once, and each
+    frame blends only their inked bounding box with a scalar opacity instead
+    of compositing a full canvas from their mask. Videos cross faded with
+    these effects are blended with a scalar opacity too. Without a
+    ``bg_color`` the clip is transparent and its mask is composited from
+    every layer's mask, full canvas: pass an opaque ``bg_color`` for
+    renders that drop the alpha channel anyway (mp4).
+    """
+
+    def __init__(self, clips, size=None, bg_color=None, use_bgclip=False, is_mask=False):
+        super().__init__(clips, size=size, bg_color=bg_color, use_bgclip=use_bgclip, is_mask=is_mask)
+        visible = [clip for clip in self.clips if not _never_visible(clip)]
+        self.index = IntervalIndex(visible, [(clip.start, clip.end) for clip in visible])
+        self.faded = {} if is_mask else {id(clip): faded for clip in visible for faded in [_faded_layer(clip)] if faded}
+        self._bg_frame = None  # The created background color, see frame_function
+
+        # The mask built by CompositeVideoClip scans every layer too
+        if isinstance(self.mask, CompositeVideoClip) and not isinstance(self.mask, TimelineCompositeVideoClip):
+            self.mask = TimelineCompositeVideoClip(self.mask.clips, self.size, is_mask=True, bg_color=0.0)
+
+    def playing_clips(self, t=0):
+        """Return the visible clips playing at time t, in layer order"""
+        if isinstance(t, np.ndarray):
+            return super().playing_clips(t)
+        return [clip for clip in self.index.at(t) if _on_screen(clip, t, self.size)]
+
+    def frame_function(self, t):
+        if isinstance(t, np.ndarray) or not self.faded or (self.bg.mask is not None and not self.created_bg):
+            return super().frame_function(t)
+        playing = self.playing_clips(t)
+        if not any(id(clip) in self.faded for clip in playing):
+            return super().frame_function(t)
+
+        # Same result as CompositeVideoClip.frame_function: faded layers are blended within their box, opaque
+        # layers pasted, and only layers with any other mask go through moviepy's full canvas compositing
+        if not self.created_bg:
+            # A background clip (use_bgclip), which can change every frame
+            frame = np.array(self.bg.get_frame(t - self.bg.start), dtype="uint8")
+        else:
+            if self._bg_frame is None:
+                frame = self.bg.get_frame(0).astype("uint8")
+                if self.bg.mask is not None:
+                    # Transparent background color
+                    frame = np.dstack([frame, (self.bg.mask.get_frame(0) * 255).astype("uint8")])
+                self._bg_frame = frame
+            frame = self._bg_frame.copy()
+        image = None
+        for clip in playing:
+            faded = self.faded.get(id(clip))
+            if faded is None and clip.mask is not None:
+                if image is None:
+                    image = Image.fromarray(frame)
+                image = clip.compose_on(image, t)
+                continue
+            if image is not None:
+                frame = np.array(image)
+                image = None
+            if faded is not None:
+                faded.blend(frame, clip, t)
+                continue
+            pasted = _paste(frame, clip, t)
+            if pasted is None:
+                image = clip.compose_on(Image.fromarray(frame), t)
+            else:
+                frame = pasted
+        if image is not None:
+            frame = np.array(image)
+        if frame.shape[2] == 4:
+            return frame[:, :, :3]
+        return frame
+
+def _faded_layer(clip):
+    """_FadedLayer of a layer whose mask is a constant coverage times an opacity, or None"""
+    if clip.mask is None or clip.size is None:
+        return None
+    faded = _still_coverage(clip.mask)
+    if faded is None or faded[0].shape != (clip.size[1], clip.size[0]):
+        return None
+    if isinstance(clip, ImageClip) and clip.img is not None and clip.img.ndim == 3 and clip.get_frame(0) is clip.img:
+        return _FadedLayer(clip, *faded, still=True)
+    if np.all(faded[0] == 1):
+        return _FadedLayer(clip, *faded, still=False)
+    return None
+
+def _never_visible(clip):
+    """True if the clip's mask is a constant, fully transparent picture"""
+    mask = clip.mask
+    if isinstance(mask, OpacityMask):
+        return not np.any(mask.coverage)
+    return isinstance(mask, ImageClip) and mask.img is not None and not np.any(mask.img)
+
+def _on_screen(clip, t, canvas_size):
+    """True if the clip, placed at its position at t, overlaps the canvas"""
+    ct = t - clip.start
+    try:
+        pos = compute_position(clip.size, canvas_size, clip.pos(ct), clip.relative_pos)
+    except Exception:
+        return True  # Can't tell, let the compositor decide
+    x, y = pos
+    w, h = clip.size
+    return x < canvas_size[0] and y < canvas_size[1] and x + w > 0 and y + h > 0
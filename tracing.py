@@ -0,0 +1,268 @@
+"""
+Structured timing of the render pipelines: spans, metrics, traces and sampling profiles
+
+A Tracer collects spans (named, timed sections such as "tts.synthesize",
+"overlay" or "encode"), frame time observations and metrics (cache stats,
+peak memory). The pipeline code calls the module level ``span`` and
+``observe`` functions, which do nothing unless a tracer is active:
+
+    tracer = Tracer(listeners=[print])
+    create_text_to_video(script, tracer=tracer)
+    print(tracer.summary())
+    tracer.export_chrome_trace("trace.json")  # open in chrome://tracing or ui.perfetto.dev
+
+With ``profile_segment=i`` the building and encoding of segment i are
+sampled by a SamplingProfiler, written with ``write_profile`` as folded
+stacks (flamegraph.pl, speedscope, inferno).
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Tracer of the running job, see use_tracer
+_tracer = None
+
+def get_tracer():
+    """Return the active tracer, or None"""
+    return _tracer
+
+def set_tracer(tracer):
+    """Make tracer the active tracer (None to disable), returns the previous one"""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+@contextmanager
+def use_tracer(tracer):
+    """Activate tracer for the duration of a block, if not None"""
+    if tracer is None:
+        yield None
+        return
+    previous = set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous)
+
+@contextmanager
+def span(name, **args):
+    """Time a block as a span of the active tracer"""
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.record(name, started, time.perf_counter() - started, args)
+
+def traced(name):
+    """Decorator timing every call of a function as a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def timed_frames(clip, name):
+    """Return a copy of clip observing the time taken by each of its frames under name"""
+    frame_function = clip.frame_function
+
+    def timed_frame_function(t):
+        started = time.perf_counter()
+        frame = frame_function(t)
+        observe(name, time.perf_counter() - started)
+        return frame
+
+    return clip.with_updated_frame_function(timed_frame_function)
+
+def observe(name, seconds):
+    """Add a duration (e.g. of one frame) to the statistics of the active tracer, without a span"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.observe(name, seconds)
+
+@contextmanager
+def segment_profile(index):
+    """Sample this thread while in the block if the active tracer profiles segment index"""
+    tracer = _tracer
+    if tracer is None or tracer.profile_segment != index:
+        yield
+        return
+    profiler = SamplingProfiler(interval=tracer.profile_interval)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        tracer.add_profile(f"segment {index}", profiler.samples)
+
+def peak_rss_mb(children=False):
+    """Peak resident memory of this process, or of its largest finished child (ffmpeg), in MB (None where unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, KB elsewhere
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss / unit
+
+class Tracer:
+    """
+    Collects the spans, observations and metrics of a render
+
+    Args:
+        listeners: Callables receiving each finished span as a dict
+            {"name", "start", "seconds", "thread", "args"}, e.g. to report
+            progress or push metrics as the render goes
+        profile_segment: Index of a segment to sample with a SamplingProfiler
+        profile_interval: Seconds between two samples
+    """
+
+    def __init__(self, listeners=None, profile_segment=None, profile_interval=0.005):
+        self.listeners = list(listeners or [])
+        self.profile_segment = profile_segment
+        self.profile_interval = profile_interval
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.stats = {}  # name -> [count, total seconds, max seconds]
+        self.metrics = {}
+        self.profiles = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, started, seconds, args=None):
+        """Add a finished span"""
+        event = {
+            "name": name,
+            "start": started - self.origin,
+            "seconds": seconds,
+            "thread": threading.current_thread().name,
+            "args": args or {},
+        }
+        with self._lock:
+            self.spans.append(event)
+            self._add_stat(name, seconds)
+        for listener in self.listeners:
+            listener(event)
+
+    def observe(self, name, seconds):
+        """Add a duration to the statistics of name"""
+        with self._lock:
+            self._add_stat(name, seconds)
+
+    def _add_stat(self, name, seconds):
+        stat = self.stats.setdefault(name, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+
+    def metric(self, name, value):
+        """Record a metric, e.g. the stats of a cache"""
+        with self._lock:
+            self.metrics[name] = value
+
+    def add_profile(self, name, samples):
+        """Merge the folded-stack samples of a SamplingProfiler under name"""
+        with self._lock:
+            self.profiles.setdefault(name, Counter()).update(samples)
+
+    def summary(self):
+        """Return per-name timing statistics, the metrics and the peak memory"""
+        with self._lock:
+            stages = {
+                name: {"count": count, "seconds": total, "mean": total / count, "max": longest}
+                for name, (count, total, longest) in self.stats.items()
+            }
+            metrics = dict(self.metrics)
+        return {
+            "elapsed": time.perf_counter() - self.origin,
+            "stages": stages,
+            "metrics": metrics,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def export_chrome_trace(self, path):
+        """Write the spans in the Chrome trace event format (chrome://tracing, ui.perfetto.dev)"""
+        pid = os.getpid()
+        threads = {}
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+            metrics = dict(self.metrics)
+        for event in spans:
+            tid = threads.setdefault(event["thread"], len(threads) + 1)
+            events.append({
+                "name": event["name"],
+                "cat": event["name"].split(".")[0],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["seconds"] * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": event["args"],
+            })
+        for name, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "otherData": {"summary": self.summary(), "metrics": metrics}}, f,
+                      default=str)
+
+    def write_profile(self, path, name=None):
+        """Write a sampling profile (the only one by default) as folded stacks: "a;b;c count" per line"""
+        if name is None:
+            if len(self.profiles) != 1:
+                raise ValueError(f"Choose a profile among: {', '.join(self.profiles) or 'none recorded'}")
+            name = next(iter(self.profiles))
+        with open(path, "w") as f:
+            for stack, count in self.profiles[name].most_common():
+                f.write(f"{stack} {count}\n")
+
+class SamplingProfiler:
+    """
+    Sample the Python stack of one thread at a fixed interval
+
+    Time spent in C code (PIL, numpy, waiting on a pipe) is attributed to
+    the Python line that called it. Samples are counted per folded stack,
+    outermost frame first.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
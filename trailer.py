@@ -2,26 +2,58 @@
 from moviepy import *
 import numpy as np
 
+# TimelineCompositeVideoClip works like CompositeVideoClip, but only composites the layers visible at each frame
+# Its CrossFadeIn/CrossFadeOut work like vfx ones, and let it fade texts and logos without recomputing their masks
+from timeline import CrossFadeIn, CrossFadeOut, TimelineCompositeVideoClip
+from decoders import DecoderPool
+# Fast color filters working on 8-bit frames
+from color import compile_color, sepia
+from framecache import FrameCache
+# Render the final video on all CPU cores
+from chunked import write_videofile_chunked
+# x264 settings suited to each kind of content
+from encoding import encoder_settings
+# Rasterized texts cache
+from textcache import TextRasterCache
+
 
 #################
 # VIDEO LOADING #
 #################
 # We load our video
-video = VideoFileClip("./resources/bbb.mp4")
+# All our scenes come from this one file. Subclips of a VideoFileClip share its single ffmpeg reader, which would
+# have to seek back and forth between scenes while compositing, so we cut them with a DecoderPool instead:
+# every scene gets its own reader, kept open across previews (at most max_open of them at once)
+video_path = "./resources/bbb.mp4"
+# While editing, the scenes are read from a 360p copy of the video that only has keyframes (built once, next to
+# bbb.mp4), and previews are composited at that size, which is much faster. decoders.preview(clip) previews a clip
+# like clip.preview(), scaling positions and sizes, so everything lands where it will in the full resolution render
+decoders = DecoderPool(max_open=6, proxy_height=360)
 
 #####################
 # SCENES EXTRACTION #
 #####################
-# We extract the scenes we want to use
+# We extract the scenes we want to use, decoders.subclip works just like video.subclipped
 
 # First the characters
-intro_clip = video.subclipped(1, 11)
-bird_clip = video.subclipped(16, 20)
-bunny_clip = video.subclipped(37, 55)
-rodents_clip = video.subclipped(
-    "00:03:34.75", "00:03:56"
+intro_clip = decoders.subclip(video_path, 1, 11)
+bird_clip = decoders.subclip(video_path, 16, 20)
+bunny_clip = decoders.subclip(video_path, 37, 55)
+rodents_clip = decoders.subclip(
+    video_path, "00:03:34.75", "00:03:56"
 )  # we can also use string notation with format HH:MM:SS.uS
-rambo_clip = video.subclipped("04:41.5", "04:44.70")
+rambo_clip = decoders.subclip(video_path, "04:41.5", "04:44.70")
+
+# We will preview these scenes many times while editing, so we keep their decoded frames in a FrameCache
+# (at most 1 GB in memory, older frames spill to a temporary folder on disk). Re-previewing a scene, even after
+# moving it, fading it or cutting it, then reads its frames from the cache instead of decoding them again (only
+# the decoding is saved: fades, cuts and filters are applied again on every preview)
+frames = FrameCache(max_bytes=1024**3, spill_dir=True)
+intro_clip = frames.cached(intro_clip)
+bird_clip = frames.cached(bird_clip)
+bunny_clip = frames.cached(bunny_clip)
+rodents_clip = frames.cached(rodents_clip)
+rambo_clip = frames.cached(rambo_clip)
 
 
 
@@ -31,11 +63,11 @@ rambo_clip = video.subclipped("04:41.5", "04:44.70")
 # Now, lets have a first look at our clips
 # Warning: you need ffplay installed for preview to work
 # We set a low fps so our machine can render in real time without slowing down
-intro_clip.preview(fps=20)
-bird_clip.preview(fps=20)
-bunny_clip.preview(fps=20)
-rodents_clip.preview(fps=20)
-rambo_clip.preview(fps=20)
+decoders.preview(intro_clip, fps=20)
+decoders.preview(bird_clip, fps=20)
+decoders.preview(bunny_clip, fps=20)
+decoders.preview(rodents_clip, fps=20)
+decoders.preview(rambo_clip, fps=20)
 
 ##############################
 # CLIPS MODIFICATION CUTTING #
@@ -50,32 +82,35 @@ rodents_clip = rodents_clip.with_section_cut_out(start_time=4, end_time=10)
 # meaning it does not modify the original data, but instead copy it and modify/return the copy
 
 # Lets check the result
-rodents_clip.preview(fps=10)
+decoders.preview(rodents_clip, fps=10)
 
 
 ############################
 # TEXT/LOGO CLIPS CREATION #
 ############################
 # Lets create the texts to put between our clips
+# texts.text_clip works like TextClip, but keeps each rasterized text in a cache, so a text used several times
+# (or created again while we edit) is only laid out and drawn once
 font = "./resources/font/font.ttf"
-intro_text = TextClip(
+texts = TextRasterCache()
+intro_text = texts.text_clip(
     font=font,
     text="The Blender Foundation and\nPeach Project presents",
     font_size=50,
     color="#fff",
     text_align="center",
 )
-bird_text = TextClip(font=font, text="An unlucky bird", font_size=50, color="#fff")
-bunny_text = TextClip(
+bird_text = texts.text_clip(font=font, text="An unlucky bird", font_size=50, color="#fff")
+bunny_text = texts.text_clip(
     font=font, text="A (slightly overweight) bunny", font_size=50, color="#fff"
 )
-rodents_text = TextClip(
+rodents_text = texts.text_clip(
     font=font, text="And three rodent pests", font_size=50, color="#fff"
 )
-revenge_text = TextClip(
+revenge_text = texts.text_clip(
     font=font, text="Revenge is coming...", font_size=50, color="#fff"
 )
-made_with_text = TextClip(font=font, text="Made with", font_size=50, color="#fff")
+made_with_text = texts.text_clip(font=font, text="Made with", font_size=50, color="#fff")
 
 # We will also need the big buck bunny logo, so lets load it and resize it
 logo_clip = ImageClip("./resources/logo_bbb.png").resized(width=400)
@@ -115,8 +150,10 @@ moviepy_clip = moviepy_clip.with_start(made_with_text.start).with_duration(3)
 # CLIPS TIMING PREVIEW #
 ########################
 # Lets make a first compositing of the clips into one single clip and do a quick preview to see if everything is synchro
+# We use TimelineCompositeVideoClip rather than CompositeVideoClip: our 13 layers are spread over ~5 minutes but only
+# 2 or 3 of them play at any time, it indexes layers by start/end so each frame only looks at the active ones
 
-quick_compo = CompositeVideoClip(
+quick_compo = TimelineCompositeVideoClip(
     [
         intro_clip,
         intro_text,
@@ -133,7 +170,7 @@ quick_compo = CompositeVideoClip(
         moviepy_clip,
     ]
 )
-quick_compo.preview(fps=10)
+decoders.preview(quick_compo, fps=10)
 
 
 
@@ -155,7 +192,7 @@ made_with_text = made_with_text.with_position(("center", 300))
 moviepy_clip = moviepy_clip.with_position(("center", 360))
 
 # Lets take another look to check positions
-quick_compo = CompositeVideoClip(
+quick_compo = TimelineCompositeVideoClip(
     [
         intro_clip,
         intro_text,
@@ -172,7 +209,7 @@ quick_compo = CompositeVideoClip(
         moviepy_clip,
     ]
 )
-quick_compo.preview(fps=10)
+decoders.preview(quick_compo, fps=10)
 
 
 
@@ -183,14 +220,18 @@ quick_compo.preview(fps=10)
 # To do so we use the with_effects method and the video effects in vfx
 # We call with_effects on our clip and pass it an array of effect objects to apply
 # We'll keep it simple, nothing fancy just cross fading
-intro_text = intro_text.with_effects([vfx.CrossFadeIn(1), vfx.CrossFadeOut(1)])
-logo_clip = logo_clip.with_effects([vfx.CrossFadeIn(1), vfx.CrossFadeOut(1)])
-bird_text = bird_text.with_effects([vfx.CrossFadeIn(0.5), vfx.CrossFadeOut(0.5)])
-bunny_text = bunny_text.with_effects([vfx.CrossFadeIn(0.5), vfx.CrossFadeOut(0.5)])
-rodents_text = rodents_text.with_effects([vfx.CrossFadeIn(0.5), vfx.CrossFadeOut(0.5)])
+# For our texts and logo we use CrossFadeIn/CrossFadeOut from timeline: their pixels never change, only their opacity,
+# so instead of computing a mask and compositing a whole 1920x1080 layer every frame, the compositor converts them
+# once and only blends the box around their pixels, with one opacity value per frame
+intro_text = intro_text.with_effects([CrossFadeIn(1), CrossFadeOut(1)])
+logo_clip = logo_clip.with_effects([CrossFadeIn(1), CrossFadeOut(1)])
+bird_text = bird_text.with_effects([CrossFadeIn(0.5), CrossFadeOut(0.5)])
+bunny_text = bunny_text.with_effects([CrossFadeIn(0.5), CrossFadeOut(0.5)])
+rodents_text = rodents_text.with_effects([CrossFadeIn(0.5), CrossFadeOut(0.5)])
 
 # Also add cross fading on video clips and video clips audio
 # See how video effects are under vfx and audio ones under afx
+# (the cross fades of videos come from timeline too, the compositor blends them with a single opacity value)
 intro_clip = intro_clip.with_effects(
     [vfx.FadeIn(1), vfx.FadeOut(1), afx.AudioFadeIn(1), afx.AudioFadeOut(1)]
 )
@@ -201,13 +242,13 @@ bunny_clip = bunny_clip.with_effects(
     [vfx.FadeIn(1), vfx.FadeOut(1), afx.AudioFadeIn(1), afx.AudioFadeOut(1)]
 )
 rodents_clip = rodents_clip.with_effects(
-    [vfx.FadeIn(1), vfx.CrossFadeOut(1.5), afx.AudioFadeIn(1), afx.AudioFadeOut(1.5)]
+    [vfx.FadeIn(1), CrossFadeOut(1.5), afx.AudioFadeIn(1), afx.AudioFadeOut(1.5)]
 )  # Just fade in, rambo clip will do the cross fade
 rambo_clip = rambo_clip.with_effects(
-    [vfx.CrossFadeIn(1.5), vfx.FadeOut(1), afx.AudioFadeIn(1.5), afx.AudioFadeOut(1)]
+    [CrossFadeIn(1.5), vfx.FadeOut(1), afx.AudioFadeIn(1.5), afx.AudioFadeOut(1)]
 )
 rambo_clip = rambo_clip.with_effects(
-    [vfx.CrossFadeIn(1.5), vfx.FadeOut(1), afx.AudioFadeIn(1.5), afx.AudioFadeOut(1)]
+    [CrossFadeIn(1.5), vfx.FadeOut(1), afx.AudioFadeIn(1.5), afx.AudioFadeOut(1)]
 )
 
 # Effects are not only for transition, they can also change a clip timing or appearance
@@ -221,7 +262,7 @@ made_with_text = made_with_text.with_start(rambo_clip.end).with_duration(3)
 moviepy_clip = moviepy_clip.with_start(made_with_text.start).with_duration(3)
 
 # Let's have a last look at the result to make sure everything is working as expected
-quick_comp = CompositeVideoClip(
+quick_comp = TimelineCompositeVideoClip(
     [
         intro_clip,
         intro_text,
@@ -238,7 +279,7 @@ quick_comp = CompositeVideoClip(
         moviepy_clip,
     ]
 )
-quick_comp.preview(fps=10)
+decoders.preview(quick_comp, fps=10)
 
 ###############
 # CLIP FILTER #
@@ -277,18 +318,31 @@ def sepia_filter(frame: np.ndarray):
     return sepia_image
 
 
+# This works, but it makes a float32 copy of every frame and runs a matrix product on each pixel.
+# The color module does the same transformation on the 8-bit frame directly, in a single pass,
+# and lets us chain more operations (levels, gamma, tint...), merged into as few passes as the result allows.
+# The result is the same as sepia_filter, up to a rounding difference on a few pixels
+fast_sepia_filter = compile_color(sepia())
+
 # Now, we simply apply the filter to our clip by calling image_transform, which will call our filter on every frame
-rambo_clip = rambo_clip.image_transform(sepia_filter)
+rambo_clip = rambo_clip.image_transform(fast_sepia_filter)
 
 # Let's see how our filter look
-rambo_clip.preview(fps=10)
+decoders.preview(rambo_clip, fps=10)
 
 
 ##################
 # CLIP RENDERING #
 ##################
 # Everything is good and ready, we can finally render our clip into a file
-final_clip = CompositeVideoClip(
+# First we switch back to the full resolution video. The frame cache was for previews: the render reads every
+# frame once, and its worker processes would each fill a copy of the cache, so we stop caching (after checking how
+# much it saved us, useful to choose its size)
+decoders.use_proxies(False)
+print(frames.stats())
+frames.disable()
+
+final_clip = TimelineCompositeVideoClip(
     [
         intro_clip,
         intro_text,
@@ -303,6 +357,32 @@ final_clip = CompositeVideoClip(
         revenge_text,
         made_with_text,
         moviepy_clip,
-    ]
+    ],
+    # An opaque black background: without one the clip is transparent, and each frame would also composite a mask
+    # from the masks of all the layers, only for the alpha channel to be dropped by the mp4
+    bg_color=(0, 0, 0),
 )
-final_clip.write_videofile("./result.mp4")
\ No newline at end of file
+# write_videofile renders every frame one after the other in a single process. Instead we split the timeline in
+# chunks rendered by as many processes as we have CPU cores, and join them at the end. The frames are the same
+# The encoder is tuned for live action footage ("film"), with a keyframe every 2 seconds, which is also where
+# chunks can start. Preset and CRF come from the 1080p render profile, pass threads=... to limit x264's threads
+final_clip_path = "./result.mp4"
+film = encoder_settings("1080p", "film")
+# Once rendered (or if the render fails), we close the decoders' ffmpeg readers and remove the cache's spill folder
+try:
+    write_videofile_chunked(
+        final_clip, final_clip_path, preset=film.preset, tune=film.tune, crf=film.crf, gop=film.gop,
+        threads=film.threads,
+    )
+finally:
+    frames.close()
+    decoders.close()
+
+#######################
+# DECLARATIVE EDITING #
+#######################
+# The same trailer is described in trailer.json: sources, cuts, effects, filters, and timings written relative to
+# other layers ("start": "rodents.end - 1.5"), so when slow motion changes rambo's duration the following layers
+# move with it, with no re-timing by hand. edit.py compiles it, plans the reads of bbb.mp4 and predicts the cost:
+#     python edit.py trailer.json --cost
+#     python edit.py trailer.json --output result.mp4
@@ -0,0 +1,243 @@
+"""Text-to-speech backends and a content-addressed on-disk cache of their audio"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tracing import span
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "INVIDEO_TTS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "invideo", "tts")
+)
+
+class Synthesizer:
+    """
+    Base class of TTS backends
+
+    Subclasses set ``name`` and ``extension`` and implement ``synthesize``,
+    which writes the speech for ``text`` to ``output_path``, giving up after
+    ``timeout`` seconds when the backend supports it. ``cache_key`` must
+    change whenever a setting changes the produced audio.
+    """
+    name = "base"
+    extension = ".mp3"
+
+    def cache_key(self):
+        return self.name
+
+    def synthesize(self, text, output_path, lang="en", slow=False, timeout=None):
+        raise NotImplementedError
+
+class GTTSSynthesizer(Synthesizer):
+    """Google Translate TTS through gTTS, needs network access"""
+    name = "gtts"
+    extension = ".mp3"
+
+    def synthesize(self, text, output_path, lang="en", slow=False, timeout=None):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang, slow=slow, timeout=timeout).save(output_path)
+
+class Pyttsx3Synthesizer(Synthesizer):
+    """Offline TTS using the local speech engine through pyttsx3 (optional dependency)"""
+    name = "pyttsx3"
+    extension = ".wav"
+
+    def __init__(self, rate=None, voice=None):
+        try:
+            import pyttsx3  # noqa: F401
+        except ImportError as e:
+            raise ImportError("pyttsx3 is required for offline TTS: pip install pyttsx3") from e
+        self.rate = rate
+        self.voice = voice
+
+    def cache_key(self):
+        return f"{self.name}:rate={self.rate}:voice={self.voice}"
+
+    def synthesize(self, text, output_path, lang="en", slow=False, timeout=None):
+        import pyttsx3
+        engine = pyttsx3.init()
+        rate = self.rate or engine.getProperty("rate")
+        engine.setProperty("rate", rate * 0.7 if slow else rate)
+        if self.voice:
+            engine.setProperty("voice", self.voice)
+        engine.save_to_file(text, output_path)
+        engine.runAndWait()
+        engine.stop()
+
+class StubSynthesizer(Synthesizer):
+    """
+    Deterministic offline backend for tests and benchmarks
+
+    Writes a quiet tone lasting as long as the text would take to read at
+    ``words_per_minute``, so durations behave like real speech.
+    """
+    name = "stub"
+    extension = ".wav"
+
+    def __init__(self, words_per_minute=150, sample_rate=22050):
+        self.words_per_minute = words_per_minute
+        self.sample_rate = sample_rate
+
+    def cache_key(self):
+        return f"{self.name}:wpm={self.words_per_minute}:sr={self.sample_rate}"
+
+    def synthesize(self, text, output_path, lang="en", slow=False, timeout=None):
+        words_per_minute = self.words_per_minute / 2 if slow else self.words_per_minute
+        duration = max(len(text.split()) / words_per_minute * 60, 0.5)
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        samples = (3000 * np.sin(2 * np.pi * 220 * t)).astype("<i2")
+        with wave.open(output_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(samples.tobytes())
+
+class AudioCache:
+    """
+    On-disk cache of synthesized speech keyed by (text, lang, slow, backend)
+
+    Files are written to a temporary name and renamed into place, so several
+    threads or processes can share one cache directory. When the directory
+    grows past ``max_bytes`` the least recently used files are removed; files
+    used less than ``min_age`` seconds ago are kept so a concurrent render never
+    loses audio it is about to read.
+    """
+
+    def __init__(self, synthesizer=None, cache_dir=DEFAULT_CACHE_DIR, max_bytes=500 * 1024 * 1024, min_age=60):
+        self.synthesizer = synthesizer or GTTSSynthesizer()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        # Locks can't be pickled, each process gets its own
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, text, lang="en", slow=False):
+        """Return the content address of the audio for these inputs"""
+        payload = json.dumps([text, lang, bool(slow), self.synthesizer.cache_key()])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key + self.synthesizer.extension)
+
+    def get(self, text, lang="en", slow=False, timeout=None):
+        """Return the path of the audio for text, synthesizing it on a cache miss"""
+        path = self.path_for(self.key(text, lang, slow))
+        try:
+            # Refresh the access time used for LRU eviction
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=self.synthesizer.extension, dir=self.cache_dir)
+        os.close(fd)
+        try:
+            with span("tts.synthesize", backend=self.synthesizer.name):
+                self.synthesizer.synthesize(text, tmp_path, lang=lang, slow=slow, timeout=timeout)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self.misses += 1
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".tmp_") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        newest_allowed = time.time() - self.min_age
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes or mtime > newest_allowed:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass  # Another process evicted it first
+
+    def stats(self):
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+class SpeechPipeline:
+    """
+    Fetch the audio of many texts concurrently through an AudioCache
+
+    At most ``max_in_flight`` requests run at once. Each request gets
+    ``timeout`` seconds and is retried ``retries`` times with exponential
+    backoff before its future raises.
+
+    Example:
+        with SpeechPipeline(cache) as speech:
+            futures = [speech.submit(text) for text in texts]
+            paths = [future.result() for future in futures]
+    """
+
+    def __init__(self, tts_cache, lang="en", slow=False, max_in_flight=8, retries=2, timeout=30, backoff=1.0):
+        self.tts_cache = tts_cache
+        self.lang = lang
+        self.slow = slow
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="tts")
+
+    def submit(self, text):
+        """Queue text for synthesis, returns a Future of its audio path"""
+        return self._pool.submit(self._fetch, text)
+
+    def _fetch(self, text):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.tts_cache.get(text, lang=self.lang, slow=self.slow, timeout=self.timeout)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self):
+        """Stop the workers, dropping requests that have not started yet"""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()